@@ -0,0 +1,149 @@
+#!/bin/env python3
+import math, sys
+from array import array
+from functools import lru_cache
+from itertools import repeat
+import tok, yard, pol
+from nda import NDarray
+
+CACHE_SIZE = 1 << 10 # compiled programs kept, keyed by source text
+CONST, CALL1, CALL2, LOAD, STORE, TEMP = range(6) # opcodes, each followed by an index into the program's tables
+
+# An expression compiled once through tok, yard and pol's operators into a flat opcode array,
+# so evaluating it again is a single loop over small integers.
+class Program:
+    def __init__(self, code, consts, funcs, names, temps=0):
+        self.code = code # array("H") of (opcode, index) pairs
+        self.consts = consts
+        self.funcs = funcs
+        self.names = names # the variables in source order, which LOAD indexes
+        self.temps = temps # slots for shared subexpressions, written by STORE and read by TEMP
+
+    def __call__(self, **env):
+        stack = []
+        push, pop = stack.append, stack.pop
+        consts, funcs, values = self.consts, self.funcs, [env[name] for name in self.names]
+        slots = [None] * self.temps
+        it = iter(self.code)
+        for op, arg in zip(it, it):
+            if op == CONST: push(consts[arg])
+            elif op == LOAD: push(values[arg])
+            elif op == STORE: slots[arg] = stack[-1]
+            elif op == TEMP: push(slots[arg])
+            elif op == CALL2:
+                y = pop()
+                stack[-1] = funcs[arg](stack[-1], y)
+            else: stack[-1] = funcs[arg](stack[-1])
+        return stack[-1]
+
+    # Evaluates over whole columns of bindings, one pass over the rows per opcode. data maps each
+    # variable to a column (a list or a 1-d NDarray), or is an NDarray with one column per variable
+    # in the order of `names`. The result is an NDarray if the columns came in NDarrays, else a list.
+    def columns(self, data):
+        if is_array := isinstance(data, NDarray):
+            data = {name: data[:, j] for j, name in enumerate(self.names)}
+        else:
+            is_array = any(isinstance(data[name], NDarray) for name in self.names)
+        cols = [list(data[name]) for name in self.names]
+        rows = {len(col) for col in cols}
+        if len(rows) > 1: raise ValueError(f"Columns should have the same length, not {sorted(rows)}")
+        stack = []
+        push, pop = stack.append, stack.pop
+        consts, funcs, slots = self.consts, self.funcs, [None] * self.temps
+        it = iter(self.code)
+        for op, arg in zip(it, it):
+            if op == CONST: push(consts[arg])
+            elif op == LOAD: push(cols[arg])
+            elif op == STORE: slots[arg] = stack[-1]
+            elif op == TEMP: push(slots[arg])
+            elif op == CALL2:
+                y = pop()
+                stack[-1] = column(funcs[arg], stack[-1], y)
+            else: stack[-1] = column(funcs[arg], stack[-1])
+        out = stack[-1] if isinstance(stack[-1], list) else [stack[-1]] * (rows.pop() if rows else 1)
+        return NDarray(out) if is_array else out
+
+    def __repr__(self):
+        it = iter(self.code)
+        names = {CONST: lambda i: repr(self.consts[i]), CALL1: lambda i: self.funcs[i].__name__,
+                 CALL2: lambda i: self.funcs[i].__name__, LOAD: lambda i: self.names[i],
+                 STORE: lambda i: f"=${i}", TEMP: lambda i: f"${i}"}
+        return f"Program({' '.join(names[op](arg) for op, arg in zip(it, it))})"
+
+# f applied row by row, with constants repeated along the columns
+def column(f, *args):
+    if not any(isinstance(a, list) for a in args): return f(*args)
+    return list(map(f, *(a if isinstance(a, list) else repeat(a) for a in args)))
+
+# the opcode program of an (optimized) rpn token list, checking that it leaves exactly one value.
+# `names` fixes the order of the variables, which otherwise follows their first use.
+def assemble(rpn, names=()):
+    # each table maps an entry to its index, in the order added
+    code, consts, funcs, temps, depth = array("H"), {}, {}, {}, 0
+    names = {name: i for i, name in enumerate(names)}
+    def index(table, x):
+        return table.setdefault(x, len(table))
+    for tk in rpn:
+        if isinstance(tk, (int, float)) or yard.is_const(tk):
+            code.extend((CONST, index(consts, float(tk) if isinstance(tk, (int, float)) else getattr(math, tk))))
+            depth += 1
+        elif tk in pol.binary:
+            code.extend((CALL2, index(funcs, pol.binary[tk])))
+            depth -= 1
+        elif yard.is_func(tk):
+            code.extend((CALL1, index(funcs, getattr(math, tk))))
+        elif tk.startswith("=$"):
+            code.extend((STORE, index(temps, tk[1:])))
+        elif tk.startswith("$"):
+            code.extend((TEMP, temps[tk]))
+            depth += 1
+        else:
+            code.extend((LOAD, index(names, tk)))
+            depth += 1
+        if depth < 1: raise ValueError(f"Missing operand for {tk}")
+    if depth != 1: raise ValueError("Expression should have exactly one value")
+    return Program(code, tuple(consts), tuple(funcs), tuple(names), len(temps))
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile(src):
+    rpn = yard.rpn(tok.tokens(src))
+    # variables in source order, even those optimized away, so the column layout never depends on folding
+    return assemble(yard.optimize(rpn), assemble(rpn).names)
+
+def evaluate(src, **env):
+    return compile(src)(**env)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:]:
+        print(evaluate(" ".join(sys.argv[1:])))
+        sys.exit()
+
+    assert evaluate("1 + 2") == 3.0, "Sums should work"
+    assert evaluate("2 ^ 3 * ( 4 + sqrt ( 16 ) ) - 1") == 63.0, "Precedence and functions should work"
+    assert evaluate("8 - 2 + 1") == 7.0 and evaluate("8 / 2 * 4") == 16.0, "Equal precedence should group left"
+    assert evaluate("2 ^ 3 ^ 2") == 512.0, "Powers should group right"
+    assert evaluate("cos ( pi )") == -1.0, "Constants from math should work"
+    assert compile("1 + 2") is compile("1 + 2"), "Programs should be cached"
+    assert len(compile("1 + 1 + 1").consts) == 1, "Constants should be shared"
+    assert compile("x * y + x").names == ("x", "y") and evaluate("x * y + x", x=2, y=3) == 8, "Variables should work"
+    f = compile("x ^ 2 + sin ( y ) * 0 + 1")
+    assert f.columns({"x": [1, 2, 3], "y": [0, 0, 0]}) == [2.0, 5.0, 10.0], "Columns should evaluate row by row"
+    xy = NDarray([[1.0, 0.0], [2.0, 0.0]])
+    assert list(f.columns(xy)) == [2.0, 5.0] and isinstance(f.columns(xy), NDarray), "Arrays should work as columns"
+    assert compile("x ^ 0 + y").names == ("x", "y") and \
+            list(compile("x ^ 0 + y").columns(NDarray([[5, 10], [6, 20]]))) == [11.0, 21.0], \
+            "Variables folded away should keep their column"
+    assert compile("2 + 3").columns({}) == [5.0], "Constant programs should give one row"
+    assert repr(compile("2 ^ 10 * x + sin ( 0 ) * 1")) == "Program(1024.0 x mul)", "Constants should be folded"
+    assert repr(compile("( x + 1 ) * ( x + 1 )")) == "Program(x 1.0 add =$0 $0 mul)", "Subexpressions should be shared"
+    assert evaluate("( x + 1 ) * ( x + 1 ) - ( x + 1 )", x=2) == 6 and compile("x * 1").columns({"x": [3]}) == [3]
+    long = " + ".join(f"x{i}" for i in range(3000))
+    assert len(compile(long).names) == 3000 and evaluate(long, **{f"x{i}": 1 for i in range(3000)}) == 3000, \
+            "Long expressions should compile without recursion"
+    deep = "( x + 1 ) * " * 1000 + "x"
+    assert evaluate(deep, x=1) == 2 ** 1000, "Deeply nested shared subexpressions should compile"
+    for bad in ["1 +", "1 2", "1 ? 2"]:
+        try: compile(bad)
+        except ValueError: continue
+        assert False, f"{bad} should be rejected"
@@ -1,22 +1,55 @@
 #!/bin/env python3
 import operator
+from collections import OrderedDict
+from functools import partial
+from itertools import accumulate, islice, repeat
 
+# Calling an _F runs the trampoline below, so the library's own recursion in tail position (written
+# with _tail) needs constant stack, while every value handed back to callers is already computed.
 class _F:
     def __init__(self,f): self.f = f
-    def __call__(self,x): return self.f(x)
-    def __mul__(self,f): return _F (lambda x: self(f(x))) # (\f. \g. \x. f (g x))
+    def __call__(self,x):
+        r = self.f(x)
+        return run(r) if type(r) is _Ap else r
+    def __mul__(self,f): return _compose ((self.stages or (self,)) + (type(f) is _F and f.stages or (f,))) # (\f. \g. \x. f (g x))
     def __pow__(self,f): return _F (lambda x: self * f(x)) # (\f. \g. \x. \y. f (g x y))
     __and__ = __call__ # f & x <=> f(x)
+    stages = () # the functions composed into this one, outermost first, when there are several
+
+# f * g * h as one function running the stages in a loop, not as nested lambdas
+def _compose(stages):
+    outer, inner = stages[0], stages[:0:-1]
+    def composed(x):
+        for g in inner: x = g(x)
+        return _tail (outer, x)
+    c = _F (composed)
+    c.stages = stages
+    return c
+
+# an application not yet run
+class _Ap:
+    def __init__(self,f,x): self.f, self.x = f, x
+
+# f(x) as a tail call: it is only run by the f(x) further up the python stack, which keeps
+# bouncing on returned applications. Only for definitions in here, as it may return an _Ap.
+def _tail(f,x): return _Ap (f, x)
+
+# the trampoline: runs applications returned in tail position until a value comes back
+def run(r):
+    while type(r) is _Ap:
+        f = r.f
+        r = f.f(r.x) if type(f) is _F else f(r.x)
+    return r
 
 F = _F (_F)
 
+# one closure per argument, the common arities written out and the rest bound with partial
 def _curry(n, f):
-    def _w(x,l):
-        l = l + [x]
-        if len(l) == n:
-            return f(*l)
-        return F (lambda x: _w(x, l))
-    return F (lambda x: _w(x,[]))
+    match n:
+        case 1: return _F (f)
+        case 2: return _F (lambda x: _F (lambda y: f(x, y)))
+        case 3: return _F (lambda x: _F (lambda y: _F (lambda z: f(x, y, z))))
+        case _: return _F (lambda x: _curry (n-1, partial (f, x)))
 
 curry = _curry(2, _curry)
 
@@ -24,31 +57,124 @@ truthy = F (bool)
 iff = F (lambda t: K if truthy (t) else flip (K))
 
 K = curry (2) (lambda x,_: x) # K-combinator (\x. \y. x)
-S = curry (3) (lambda f,g,x: (f(x) * g)(x)) # S-combinator (\f. \g. \x. (f x) (g x))
+S = curry (3) (lambda f,g,x: _tail (f (x), g (x))) # S-combinator (\f. \g. \x. (f x) (g x))
 I = S (K) (K) # I-combinator (\x. x), (I x) == ((S K K) x)
-apply = curry (2) (lambda f,g: f (g))
+apply = curry (2) (lambda f,g: _tail (f, g))
 flip = curry (3) (lambda f,y,x: f (x) (y))
 
+# Memoization, keyed by the arguments so far: a curried function is memoized per argument position,
+# each partial application being cached and memoized in turn. Unhashable arguments are not cached.
+# Recursion through a memo is not in tail position, so a call nested more than MEMO_DEPTH memoized
+# calls deep is run first, from the outermost call, and the calls above it are retried on its
+# cached result: the python stack stays bounded however deep the recursion goes.
+MEMO_SIZE = 1 << 12 # results kept by each memo, least recently used are evicted first
+MEMO_DEPTH = 32
+
+class _Cache:
+    def __init__(self,size): self.size, self.data, self.hits, self.misses = size, OrderedDict(), 0, 0
+    def __repr__(self): return f"hits={self.hits} misses={self.misses} size={len(self.data)}/{self.size}"
+
+# a memoized call too deeply nested, to be run from the outermost one
+class _Deeper(Exception):
+    def __init__(self,m,x): self.m, self.x = m, x
+
+_depth = 0 # memoized calls being computed
+
+def _outermost(m, x):
+    global _depth
+    pending = [(m, x)]
+    while pending:
+        _depth = 1
+        try: r = pending[-1][0](pending[-1][1])
+        except _Deeper as d: pending.append((d.m, d.x))
+        else: pending.pop()
+        finally: _depth = 0
+    return r
+
+def _memo(f, cache, key):
+    def m(x):
+        global _depth
+        try: k = key + (x,); hash(k)
+        except TypeError: return f (x)
+        if k in cache.data:
+            cache.hits += 1
+            cache.data.move_to_end(k)
+            return cache.data[k]
+        if _depth == 0: return _outermost(m, x)
+        if _depth > MEMO_DEPTH: raise _Deeper(m, x)
+        _depth += 1
+        try: r = f (x)
+        finally: _depth -= 1
+        cache.misses += 1
+        if type(r) is _F: r = _memo(r, cache, k)
+        cache.data[k] = r
+        if len(cache.data) > cache.size: cache.data.popitem(last=False)
+        return r
+    g = _F (m)
+    g.cache = cache
+    return g
+
+memo = F (lambda f: _memo (f, _Cache (MEMO_SIZE), ()))
+
 # Implementation of list functionality (with as few python builtins as possible)
-_index = curry (2) (list.__getitem__)
+
+# l[:stop] without copying, which is all `tail` needs since `head` is the last element
+class _View:
+    def __init__(self,l,stop): self.l, self.stop = l, stop
+    def __len__(self): return self.stop
+    def __iter__(self): return islice(self.l, self.stop)
+    def __getitem__(self,i):
+        r = range(self.stop)[i]
+        if type(r) is int: return self.l[r]
+        return _View(self.l, r.stop) if r.start == 0 and r.step == 1 else [self.l[j] for j in r]
+    def __add__(self,l): return list(self) + l
+    def __eq__(self,l): return list(self) == list(l) if isinstance(l, (list, _View)) else NotImplemented
+    def __repr__(self): return repr(list(self))
+
+_Done = object() # no element peeked (yet)
+
+# A lazy list backed by an iterator, walked once like the generator behind it. Its head is the
+# first element, but it answers l[-1] and l[:-1] like a list does for `head` and `tail`. The tail
+# is a new stream on the same iterator, so the head stays readable after it is taken.
+class _Stream:
+    def __init__(self,it): self.it, self.next = iter(it), _Done
+    def _peek(self):
+        if self.next is _Done: self.next = next(self.it, _Done)
+        return self.next
+    def __bool__(self): return self._peek() is not _Done
+    def __getitem__(self,i):
+        if i == -1 and self: return self.next
+        if i == slice(None, -1) and self: return _Stream(self.it)
+        raise IndexError("streams only have a head and a tail")
+    def __iter__(self):
+        if self.next is not _Done:
+            yield self.next
+            self.next = _Done
+        yield from self.it
+    def __repr__(self): return "<stream>"
+
+stream = F (_Stream)
+
+_index = curry (2) (lambda l,i: (_View(l, len(l)) if type(l) is list else l)[i])
 _rng = curry (2) (slice)
 cat = curry (2) (lambda x,l: l+[x])
+_push = curry (2) (lambda x,l: l.append(x) or l) # cat, in place, for accumulators no one else holds
 
 head = flip (_index) & -1
 tail = flip (_index) & _rng (None) (-1)
 
-index = curry (2) (lambda i,l: iff (i==0) (head) (index (i-1) * tail) & l)
+index = curry (2) (lambda i,l: _tail (iff (i==0) (head) (index (i-1) * tail), l))
 
 ## S and K combinators here since python is not lazy and if-body is evaluated before the
 ## conditional is checked.
-_rev = curry (2) (lambda l,a: iff (l) (S & _rev * tail & flip (cat) (a) * head) (K (a)) & l)
+_rev = curry (2) (lambda l,a: _tail (iff (l) (S & _rev * tail & flip (_push) (a) * head) (K (a)), l))
 rev = F (lambda l: _rev (l) ([]))
 
-foldr = curry (3) (lambda f,b,l: iff (l) (S & f * head & foldr (f) (b) * tail) (K & b) & l)
-foldl = curry (2) (lambda f,b: foldr (flip (f)) (b) * rev)
+foldr = curry (3) (lambda f,b,l: _tail (iff (l) (S & f * head & foldr (f) (b) * tail) (K & b), l))
+foldl = curry (3) (lambda f,b,l: _tail (iff (l) (S & foldl (f) * f (b) * head & tail) (K & b), l))
 
-_mapp = curry (3) (lambda f,l,a: iff (l) (S & _mapp (f) * tail & flip (cat) (a) * f * head) (K & a) & l)
-mapp = curry (2) (lambda f,l: _mapp (f) (l) ([]))
+_mapp = curry (3) (lambda f,l,a: _tail (iff (l) (S & _mapp (f) * tail & flip (_push) (a) * f * head) (K & a), l))
+mapp = curry (2) (lambda f,l: stream (map (f, l)) if type(l) is _Stream else _mapp (f) (l) ([]))
 
 # Curry and add some functions to the local scope from module "operator"
 assign = curry (3) (operator.setitem) # a,i,x -> a[i]=x
@@ -58,10 +184,16 @@ add_binop = S & assign (locals()) & curry (2) * get (operator)
 mapp (add_binop) (["add", "sub", "mul", "truediv", "eq"])
 
 # More list-functions
-summ = foldr (add) (0)
-prod = foldr (mul) (1)
+summ = foldl (add) (0)
+prod = foldl (mul) (1)
 length = summ * mapp (K & 1)
 
+# Lazy stages, taking any iterable (lists first to last) and giving streams
+filterr = curry (2) (lambda p,l: stream (filter (p, l)))
+take = curry (2) (lambda n,l: stream (islice (l, n)))
+iterate = curry (2) (lambda f,x: stream (accumulate (repeat (f), lambda x,f: f (x), initial=x)))
+zipWith = curry (3) (lambda f,l1,l2: stream (map (lambda x,y: f (x) (y), l1, l2)))
+
 # Aaaaand back again...
 to_py = F (lambda f: lambda *xs: foldl (apply) (f) (list(xs)))
 
@@ -75,5 +207,13 @@ if __name__ == "__main__":
     print("Sum:", summ_py(l))
     print("Product:", prod_py(l))
     print("Count:", length_py(l))
-    print("Fun fact, this library cannot handle bigger lists!")
+    l = list(range(1,100001))
+    print("Bigger lists work too, the sum of 1-100000 is", summ_py(l))
+    odd_squares = mapp (mul & 2) * filterr (F (lambda x: x % 2)) * mapp (S & mul & I)
+    fib = memo (F (lambda n: iff (n < 2) (I) (S & add * fib * flip (sub) (1) & fib * flip (sub) (2)) & n))
+    print("Memoized recursion shares its subterms, fib 90 is", fib (90), "with", fib.cache)
+    count = memo (F (lambda n: iff (n == 0) (K & 0) ((add & 1) * count * flip (sub) (1)) & n))
+    assert count (20000) == 20000, "Memoized recursion should not be limited by the python stack"
+    assert head (rev (stream ([1,2,3]))) == 3, "A stream's tail should leave its head readable"
+    print("As do endless ones, twice the first 1000 odd squares sum to", (summ * take (1000) * odd_squares * iterate (add & 1)) (0))
 
@@ -0,0 +1,33 @@
+#!/bin/env python3
+import sys, time
+from fun import F, S, K, I, flip, curry, add
+
+def per_call(f, n):
+    t = time.perf_counter()
+    for _ in range(n): f()
+    return (time.perf_counter() - t) / n * 1e9
+
+# each case next to the same thing written with plain python closures
+k = lambda x: lambda y: x
+s = lambda f: lambda g: lambda x: f(x)(g(x))
+plain_add = lambda x: lambda y: x + y
+inc = F (lambda x: x + 1)
+chain = inc
+for _ in range(99): chain = chain * inc
+plain_chain = lambda x: x
+for _ in range(100): plain_chain = (lambda g: lambda x: g(x) + 1)(plain_chain)
+cases = {
+    "K x y": (lambda: K (1) (2), lambda: k (1) (2)),
+    "I x": (lambda: I (1), lambda: s (k) (k) (1)),
+    "S K K x": (lambda: S (K) (K) (1), lambda: s (k) (k) (1)),
+    "flip add y x": (lambda: flip (add) (1) (2), lambda: plain_add (2) (1)),
+    "curry (3) f x y z": (lambda: curry (3) (lambda x, y, z: x) (1) (2) (3), lambda: (lambda x, y, z: x)(1, 2, 3)),
+    "100 compositions": (lambda: chain (0), lambda: plain_chain (0)),
+}
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if sys.argv[1:] else 20000
+    print(f"{'':18} {'fun.py':>10} {'closures':>10}")
+    for name, (fun, plain) in cases.items():
+        a, b = per_call(fun, n), per_call(plain, n)
+        print(f"{name:18} {a:8.0f}ns {b:8.0f}ns  ({a / b:.1f}x)")
@@ -1,3 +1,20 @@
+from collections import OrderedDict
+from itertools import count
+from oojson import NUMBER, STRING, number, unescape # the token scanners, shared with oojson
+
+LOOKAHEAD = True # let oneof pick candidates from the next character
+MEMO_SIZE = 1 << 16 # results kept by the packrat cache, least recently used are evicted first
+_memo, _parse, _parses = OrderedDict(), None, count() # the cache, and the parse_json call it belongs to
+
+# `first` holds for the next character whenever p succeeds (None if unknown),
+# `empty` marks parsers that always succeed without consuming anything
+def meta(p, first=None, empty=False):
+    p.first, p.empty = first, empty
+    return p
+
+def first(p): return getattr(p, "first", None)
+def empty(p): return getattr(p, "empty", False)
+
 def foldl(f, xs):
     assert xs
     match xs:
@@ -9,17 +26,17 @@ def fmap(f,p):
         match p(s):
             case None: return None
             case x,rs: return f(x), rs
-    return np
+    return meta(np, first(p), empty(p))
 
 def pure(x):
-    return lambda s: (x, s)
+    return meta(lambda s: (x, s), empty=True)
 
 def sec(pf, p):
     def np(s):
         match pf(s):
             case None: return None
             case f,rs: return fmap(f,p)(rs)
-    return np
+    return meta(np, first(p) if empty(pf) else first(pf), empty(pf) and empty(p))
 
 def liftA2(f, p1, p2):
     return sec(fmap(lambda x: lambda y: f(x,y), p1), p2)
@@ -28,11 +45,33 @@ def seqA(ps):
     return foldl((lambda p1,p2: liftA2(lambda x,y: x+[y], p1, p2)), [pure([])] + ps)
 
 def oneof(*ps):
+    table = {}
     def np(s):
-        match ps[0](s):
-            case None: return oneof(*ps[1:])(s) if len(ps) > 1 else None
-            case r: return r
-    return np
+        c = s[0] if s else ""
+        if not LOOKAHEAD: cs = ps
+        elif (cs := table.get(c)) is None:
+            cs = table[c] = [p for p in ps if first(p) is None or c and first(p)(c)]
+        for p in cs:
+            if (r := p(s)) is not None: return r
+        return None
+    return meta(np, None if any(first(p) is None for p in ps) else lambda c: any(first(p)(c) for p in ps))
+
+# packrat memoization, keyed by parser and position (the length of the remaining input). Positions
+# only identify the input within one parse_json call, so results are cached per call and not outside one.
+# The rest of the input is kept as its length and sliced again from s, so no entry pins a copy of it.
+def memo(p):
+    def np(s):
+        if _parse is None: return p(s)
+        if (key := (_parse, id(p), len(s))) in _memo:
+            _memo.move_to_end(key)
+            match _memo[key]:
+                case x, n: return x, s[len(s) - n:]
+            return None
+        r = p(s)
+        _memo[key] = r and (r[0], len(r[1]))
+        if len(_memo) > MEMO_SIZE: _memo.popitem(last=False)
+        return r
+    return meta(np, first(p), empty(p))
 
 def left(pl,pr):
     return liftA2(lambda x,y: x, pl, pr)
@@ -57,14 +96,18 @@ def more(p):
         match many(p)(s):
             case [],_: return None
             case r: return r
-    return np
+    return meta(np, first(p))
 
                         
 def pc(c):
-    return lambda s: (c,s[1:]) if s and c == s[0] else None
+    return meta(lambda s: (c,s[1:]) if s and c == s[0] else None, c.__eq__)
 
 def pt(f):
-    return lambda s: (s[0], s[1:]) if s and f(s[0]) else None
+    return meta(lambda s: (s[0], s[1:]) if s and f(s[0]) else None, f)
+
+# a whole token in one regex match, f builds the value from the match object
+def pr(rx, f, chars):
+    return meta(lambda s: (f(m), s[m.end():]) if (m := rx.match(s)) else None, frozenset(chars).__contains__)
 
 pd = pt(str.isdigit)
 pn = fmap(int, join(more(pd)))
@@ -76,16 +119,24 @@ ws = many(pt(str.isspace))
 def sepby(sep, p):
     return oneof(liftA2(lambda f,rs: [f] + rs, p, many(right(ws, right(sep, right(ws, p))))), pure([]))
 
-pJson = lambda s: oneof(pNull, pBool, pDigit, pLit, pArray, pObject)(s)
+pJson = lambda s: pValue(s)
 pNull = fmap(lambda x: None, ps("null"))
 pBool = fmap(lambda r: r == "true", oneof(ps("true"), ps("false")))
-pDigit = pn
-pLit = left(right(pc("\""), join(many(oneof(ps("\\\""), pt(lambda c: c != "\""))))), pc("\""))
+pDigit = pr(NUMBER, number, "-0123456789")
+pLit = pr(STRING, unescape, '"')
 pArray = left(right(pc("["), right(ws, sepby(pc(","), pJson))), right(ws, pc("]")))
 pObject = left(right(pc("{"), right(ws, fmap(dict, sepby(pc(","), liftA2(lambda k, v: (k, v), left(pLit, right(ws, pc(":"))), right(ws, pJson)))))), right(ws, pc("}")))
 
+pValue = oneof(pNull, pBool, pDigit, pLit, pArray, pObject)
+
 def parse_json(s):
-    match pJson(s):
+    global _parse
+    outer, _parse = _parse, next(_parses)
+    try: r = pJson(s)
+    finally:
+        _parse = outer
+        if outer is None: _memo.clear()
+    match r:
         case x, "": return x
         case _: return None
 
@@ -0,0 +1,150 @@
+#!/bin/env python3
+# Throughput, peak memory and limits of funjson and oojson next to json.loads,
+# failing (exit status 1) when any parser disagrees with json.loads.
+#   json_bench.py [scale]           corpora table, scale multiplies the corpus sizes
+#   json_bench.py configs [depth]   lookahead/packrat configurations on nested documents
+#   json_bench.py dumps [scale]     oodump next to json.dumps, writing the same corpora
+import json, sys, time, tracemalloc
+import funjson, oojson, oodump
+
+def nested(depth, width):
+    if depth == 0: return [1, "leaf", True, None]
+    return {f"k{i}": [i, nested(depth - 1, width)] for i in range(width)}
+
+def deep(n): return "[" * n + "]" * n
+def long_array(n): return json.dumps(list(range(n)))
+def big_string(n): return json.dumps("lorem ipsum " * (n // 12))
+def small_objects(n): return json.dumps([{"id": i, "name": f"n{i}", "ok": i % 2 == 0, "tags": [], "x": None} for i in range(n)])
+def escapes(n): return json.dumps(['say "hi"\\ \t\n café  '] * n)
+
+corpora = {
+    "deep nesting": lambda k: deep(50 * k),
+    "long array": lambda k: long_array(2000 * k),
+    "big string": lambda k: big_string(20000 * k),
+    "small objects": lambda k: small_objects(200 * k),
+    "escapes": lambda k: escapes(200 * k),
+    "nested": lambda k: json.dumps(nested(3, 2 + k)),
+}
+
+parsers = {
+    "json.loads": json.loads,
+    "funjson": funjson.parse_json,
+    "oojson": oojson.pJson.parse,
+    "oojson compiled": oojson.pJson.compile().parse,
+}
+
+def throughput(parse, doc, repeat=3):
+    best = min(timed(parse, doc) for _ in range(repeat))
+    return len(doc) / best / 1e6
+
+def timed(parse, doc):
+    t = time.perf_counter()
+    parse(doc)
+    return time.perf_counter() - t
+
+def attempt(parse, doc):
+    try: return parse(doc)
+    except (RecursionError, MemoryError) as e: return e
+
+# peak bytes allocated by one parse, and its result
+def traced(parse, doc):
+    tracemalloc.start()
+    try: return attempt(parse, doc), tracemalloc.get_traced_memory()[1]
+    finally: tracemalloc.stop()
+
+def agrees(parse, doc):
+    try: return parse(doc) == json.loads(doc)
+    except RecursionError: return False
+
+# largest n for which doc(n) still parses like json.loads, doubling up to cap then bisecting,
+# and giving up on sizes that take longer than budget seconds
+def limit(parse, doc, cap, budget=1.0):
+    ok, n = 0, 1
+    while n <= cap:
+        d = doc(n)
+        t = time.perf_counter()
+        if not agrees(parse, d): break
+        ok, n = n, n * 2
+        if time.perf_counter() - t > budget: return ok, "time"
+    else:
+        return ok, "cap"
+    bad = n
+    while bad - ok > max(1, ok // 64):
+        mid = (ok + bad) // 2
+        ok, bad = (mid, bad) if agrees(parse, doc(mid)) else (ok, mid)
+    return ok, "fails"
+
+def report(scale):
+    identical = True
+    for corpus, make in corpora.items():
+        doc = make(scale)
+        expected = json.loads(doc)
+        print(f"{corpus}, {len(doc)} bytes")
+        for name, parse in parsers.items():
+            result, peak = traced(parse, doc)
+            if isinstance(result, Exception):
+                print(f"  {name:16} {type(result).__name__} (a limit, see below)")
+                continue
+            same = result == expected
+            identical &= same
+            print(f"  {name:16} {throughput(parse, doc):8.3f} MB/s  {peak / 1024:9.0f} KiB peak" + ("" if same else "  DIFFERS"))
+    print("limits (largest passing size; 'time' stops at 1s per document, 'cap' at the probe cap)")
+    for name, parse in parsers.items():
+        depth, why_d = limit(parse, deep, 1 << 16)
+        length, why_l = limit(parse, lambda n: json.dumps("a" * n), 1 << 24)
+        print(f"  {name:16} depth {depth:>7} ({why_d})  string {length:>9} ({why_l})")
+    return identical
+
+def packrat(enabled):
+    oojson.pValue = oojson.pValue.memo if enabled else plain_oo
+    funjson.pValue = funjson.memo(plain_fun) if enabled else plain_fun
+
+def lookahead(enabled):
+    oojson.P.lookahead = funjson.LOOKAHEAD = enabled
+
+plain_oo, plain_fun = oojson.pValue, funjson.pValue
+configs = {"plain": (False, False), "lookahead": (True, False), "packrat": (False, True), "both": (True, True)}
+
+def compare_configs(depth):
+    combinators = {"funjson": funjson.parse_json, "oojson": oojson.pJson.parse}
+    for d in range(1, depth + 1):
+        doc = json.dumps(nested(d, 3))
+        print(f"nested depth {d}, {len(doc)} bytes (MB/s)")
+        for name, parse in combinators.items():
+            row = []
+            for config, (la, pr) in configs.items():
+                lookahead(la); packrat(pr)
+                assert parse(doc) == json.loads(doc)
+                row.append(f"{config} {throughput(parse, doc):.3f}")
+            print(f"  {name:8} " + "  ".join(row))
+    lookahead(True); packrat(False)
+
+class Discard:
+    def write(self, s): pass
+
+def compare_dumps(scale):
+    writers = {"json.dumps": lambda x: json.dumps(x, ensure_ascii=False), "oodump": oodump.dumps}
+    for corpus, make in corpora.items():
+        value = json.loads(make(scale))
+        size = len(json.dumps(value, ensure_ascii=False))
+        print(f"{corpus}, {size} bytes")
+        for name, write in writers.items():
+            assert write(value) == writers["json.dumps"](value)
+            best = min(timed(write, value) for _ in range(3))
+            print(f"  {name:10} {size / best / 1e6:8.3f} MB/s")
+    n = 100000 * scale
+    rows = lambda: ({"id": i, "name": f"n{i}", "ok": True} for i in range(n))
+    print(f"streaming {n} generated rows (peak KiB)")
+    _, peak = traced(lambda g: json.dump(list(g), Discard(), ensure_ascii=False), rows())
+    print(f"  {'json.dump':10} {peak / 1024:9.0f} (needs a list)")
+    _, peak = traced(lambda g: oodump.dump(g, Discard()), rows())
+    print(f"  {'oodump':10} {peak / 1024:9.0f}")
+
+if __name__ == "__main__":
+    match sys.argv[1:]:
+        case ["configs", *depth]:
+            compare_configs(int(depth[0]) if depth else 4)
+        case ["dumps", *scale]:
+            compare_dumps(int(scale[0]) if scale else 1)
+        case scale:
+            sys.exit(0 if report(int(scale[0]) if scale else 1) else 1)
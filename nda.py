@@ -1,44 +1,474 @@
-from functools import singledispatchmethod
-from operator import add
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, singledispatchmethod
+from itertools import accumulate, chain, islice, product as indices, repeat
+from multiprocessing.shared_memory import SharedMemory
+import math, mmap as _mmap, multiprocessing, operator, os, struct, sys
 
 def product(ns):
-    P = 1
-    for n in ns: P *= n
-    return P
+    return math.prod(ns)
+
+def contiguous_strides(shape):
+    strides, step = [], 1
+    for n in reversed(shape):
+        strides.append(step)
+        step *= n
+    return tuple(reversed(strides))
+
+def row_bases(shape, strides, offset, rows=None):
+    if rows is None:
+        bases = [offset]
+        for m, st in zip(shape, strides):
+            bases = [b + i*st for b in bases for i in range(m)]
+        return bases
+    bases = []
+    for r in rows:
+        b = offset
+        for m, st in zip(reversed(shape), reversed(strides)):
+            r, i = divmod(r, m)
+            b += i*st
+        bases.append(b)
+    return bases
+
+# buffer positions of every element, in row-major order of `shape`
+def flat_positions(shape, strides, offset):
+    if not shape: return (offset,)
+    *outer, n = shape
+    *outer_strides, s = strides
+    return chain.from_iterable(range(b, b + n*s, s) if s else repeat(b, n)
+                               for b in row_bases(outer, outer_strides, offset))
+
+# the elements along the last axis, one iterable per row (or per row in `rows`)
+def lanes(buf, shape, strides, offset, rows=None):
+    *outer, n = shape
+    *outer_strides, s = strides
+    for b in row_bases(outer, outer_strides, offset, rows):
+        if s > 0: yield buf[b:b + n*s:s]
+        elif s and n: yield map(buf.__getitem__, range(b, b + n*s, s))
+        else: yield repeat(buf[b], n) if n else ()
+
+class dtype:
+    def __init__(self, name, code, kind, rank):
+        self.name, self.code, self.kind, self.rank = name, code, kind, rank
+        self.itemsize = array(code).itemsize
+
+    def __repr__(self):
+        return self.name
+
+bool_ = dtype("bool", "B", bool, 0)
+int8 = dtype("int8", "b", int, 1)
+int32 = dtype("int32", "i", int, 2)
+int64 = dtype("int64", "q", int, 3)
+float32 = dtype("float32", "f", float, 4)
+float64 = dtype("float64", "d", float, 5)
+dtypes = {d.code: d for d in (bool_, int8, int32, int64, float32, float64)}
+dtypes.update({d.name: d for d in list(dtypes.values())})
+
+# the smallest dtype holding every operand; python scalars only contribute their kind
+def promote(*operands):
+    strong = [a.dtype for a in operands if isinstance(a, (NDarray, Lazy))]
+    weak = {type(a) for a in operands if not isinstance(a, (NDarray, Lazy))}
+    res = max(strong, key=lambda d: d.rank, default=bool_)
+    if res is float32 and (int32 in strong or int64 in strong): res = float64
+    if float in weak and res.kind is not float: res = float64
+    elif int in weak and res is bool_: res = int64
+    return res
+
+def arithmetic(*operands):
+    res = promote(*operands)
+    return int64 if res is bool_ else res
+
+def floating(*operands):
+    res = promote(*operands)
+    return res if res.kind is float else float64
+
+def comparison(*operands):
+    return bool_
+
+def typecode(buf):
+    return buf.typecode if isinstance(buf, array) else buf.format
+
+WRAP_CHUNK = 1 << 12 # values converted at a time into integer dtypes that wrap
+
+# Without a dtype, integers too large for int64 are stored as float64 like any other non-integer.
+# With `wrap`, integers outside an integer dtype wrap around its range, as in numpy's arithmetic.
+# Those are filled a chunk at a time, so only a chunk of values is ever boxed at once.
+def to_buffer(values, dtype=None, wrap=False):
+    if dtype is not None:
+        dtype = dtypes.get(dtype, dtype)
+        if not wrap or dtype.kind is not int:
+            try: return array(dtype.code, values)
+            except OverflowError: raise OverflowError(f"Values out of range for {dtype}") from None
+        buf, it, half = array(dtype.code), iter(values), 1 << (8*dtype.itemsize - 1)
+        while chunk := list(islice(it, WRAP_CHUNK)):
+            try: buf.fromlist(chunk)
+            except OverflowError: buf.fromlist([(v + half) % (2*half) - half for v in chunk])
+        return buf
+    values = list(values)
+    if values and all(type(v) is bool for v in values): return array(bool_.code, values)
+    try: return array(int64.code, values)
+    except (TypeError, OverflowError): return array(float64.code, values)
+
+MAGIC = b"NDA1"
+BLOCK = 64 # rows and columns per output tile in matmul
+PARALLEL_MATMUL = 1 << 24 # multiply-adds before matmul splits its rows over threads
+
+# out[i*m + j] = rows[i] . cols[j] for rows i0..i1, one BLOCK x BLOCK tile at a time
+def matmul_block(rows, cols, out, i0, i1):
+    m = len(cols)
+    for r0 in range(i0, i1, BLOCK):
+        block = rows[r0:min(r0 + BLOCK, i1)]
+        for c0 in range(0, m, BLOCK):
+            tile = cols[c0:c0 + BLOCK]
+            for i, row in enumerate(block, r0):
+                out[i*m + c0:i*m + c0 + len(tile)] = [sum(map(operator.mul, row, col)) for col in tile]
+
+def matmul2d(a, b, workers=None):
+    (n, k), m = a.dim, b.dim[1]
+    a, bt = (a if a.contiguous else a.copy()), b.T.copy()
+    rows = [a.buf[a.offset + i*k:a.offset + (i+1)*k].tolist() for i in range(n)]
+    cols = [bt.buf[j*k:(j+1)*k].tolist() for j in range(m)]
+    out = [0] * (n*m)
+    if workers is None:
+        workers = os.cpu_count() if n*m*k >= PARALLEL_MATMUL else 1
+    if workers > 1 and n > BLOCK:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(lambda i: matmul_block(rows, cols, out, i, min(i + BLOCK, n)), range(0, n, BLOCK)))
+    else:
+        matmul_block(rows, cols, out, 0, n)
+    return out
+
+WORKERS = 1 # processes used for elementwise work and reductions, see `parallel`
+PARALLEL_ELEMENTS = 1 << 18 # smaller outputs are always computed serially
+
+@contextmanager
+def parallel(workers=None, threshold=PARALLEL_ELEMENTS):
+    global WORKERS, PARALLEL_ELEMENTS
+    saved = WORKERS, PARALLEL_ELEMENTS
+    WORKERS, PARALLEL_ELEMENTS = workers or os.cpu_count(), threshold
+    try: yield
+    finally: WORKERS, PARALLEL_ELEMENTS = saved
+
+def run_parallel(size):
+    return WORKERS > 1 and size >= PARALLEL_ELEMENTS and "fork" in multiprocessing.get_all_start_methods()
+
+# workers are forked with the task in place, so neither `f` nor the operands are ever pickled
+_task = None
+
+def _run_span(span):
+    task, out, code, infer = _task
+    if out is None: return task(*span)
+    start, stop = span
+    values = task(start, stop)
+    if infer and code == bool_.code:
+        values = list(values)
+        if not all(type(v) is bool for v in values): raise TypeError("Results are not all bools")
+    view = out.buf.cast(code)
+    view[start:stop] = to_buffer(values, code, wrap=not infer)
+    view.release()
+
+# run task(start, stop) over spans of range(size) in forked processes. With a dtype every span's
+# values are written into one shared buffer that is returned, otherwise the span results are.
+# With `infer` the dtype is picked like to_buffer does serially, from bool to int64 to float64,
+# while results that overflow a known integer dtype wrap around as they do serially.
+def in_processes(task, size, dtype=None, infer=False):
+    global _task
+    if infer and dtype is None:
+        first = next(iter(task(0, 1)))
+        dtype = bool_ if type(first) is bool else int64 if isinstance(first, int) else float64
+    code = dtype and dtype.code
+    out = SharedMemory(create=True, size=max(1, size * dtype.itemsize)) if dtype else None
+    step = -(-size // (4*WORKERS))
+    _task = task, out, code, infer
+    try:
+        with ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("fork")) as pool:
+            res = list(pool.map(_run_span, [(i, min(i + step, size)) for i in range(0, size, step)]))
+        if out is None: return res
+        buf = array(code)
+        buf.frombytes(out.buf[:size * dtype.itemsize])
+        return buf
+    except (TypeError, OverflowError):
+        if not infer or dtype is float64: raise
+        return in_processes(task, size, int64 if dtype is bool_ else float64, infer=True)
+    finally:
+        _task = None
+        if out is not None:
+            out.close()
+            out.unlink()
+
+# the elements of `a` with flat indices start..stop
+def span_of(a, start, stop):
+    n = a.dim[-1]
+    it = chain.from_iterable(lanes(a.buf, a.dim, a.strides, a.offset, range(start // n, -(-stop // n))))
+    it = islice(it, start % n, start % n + stop - start)
+    return map(bool, it) if a.dtype is bool_ else it
+
+def asarray(a):
+    return a if isinstance(a, NDarray) else NDarray(a)
+
+def nest(it, shape):
+    if not shape: return next(it)
+    return [nest(it, shape[1:]) for _ in range(shape[0])]
 
 class NDarray:
-    def __init__(self, arr):
-        self.dim = NDarray.shape(arr)
-        self.size = product(self.dim)
-        self.arr = arr
+    def __init__(self, arr, dtype=None):
+        dim = NDarray.shape(arr)
+        flat = [arr]
+        for _ in dim: flat = chain.from_iterable(flat)
+        self._view(to_buffer(flat, dtype), dim)
+
+    def _view(self, buf, dim, strides=None, offset=0):
+        self.buf = buf
+        self.dim = dim
+        self.strides = contiguous_strides(dim) if strides is None else strides
+        self.offset = offset
+        self.size = product(dim)
+        return self
+
+    @staticmethod
+    def from_buffer(buf, dim, strides=None, offset=0):
+        return object.__new__(NDarray)._view(buf, tuple(dim), strides, offset)
+
+    @property
+    def arr(self):
+        return nest(iter(self), self.dim)
+
+    @property
+    def dtype(self):
+        return dtypes[typecode(self.buf)]
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def astype(self, dtype):
+        dtype = dtypes.get(dtype, dtype)
+        return NDarray.from_buffer(to_buffer(map(dtype.kind, self), dtype, wrap=True), self.dim)
+
+    @property
+    def contiguous(self):
+        return self.strides == contiguous_strides(self.dim)
 
     def __len__(self):
         return self.size
 
+    def __iter__(self):
+        if self.contiguous:
+            it = iter(memoryview(self.buf)[self.offset:self.offset + self.size])
+        elif not self.dim:
+            it = iter((self.buf[self.offset],))
+        else:
+            it = chain.from_iterable(lanes(self.buf, self.dim, self.strides, self.offset))
+        return map(bool, it) if self.dtype is bool_ else it
+
+    def __repr__(self):
+        return f"NDarray({self.arr})"
+
     @singledispatchmethod
     def __getitem__(self, i): ...
     
     @__getitem__.register
     def _(self, idx: tuple):
-        assert len(idx) == len(self.dim), "Dimension mismatch"
-        el = self.arr
-        for i in idx: el = el[i]
-        return el
+        assert len(idx) <= len(self.dim), "Dimension mismatch"
+        if len(idx) < len(self.dim) or not all(isinstance(i, int) for i in idx):
+            return self.view(idx)
+        pos = self.offset
+        for i, n, s in zip(idx, self.dim, self.strides):
+            if i < 0: i += n
+            if not 0 <= i < n: raise IndexError("index out of range")
+            pos += i*s
+        return self._item(pos)
+
+    @__getitem__.register
+    def _(self, sl: slice):
+        return self.view((sl,))
 
     @__getitem__.register
     def _(self, i: int):
-        idx = []
-        for ix in range(len(self.dim)):
-            leap = product(self.dim[ix+1:])
-            idx.append(i // leap)
-            i = i % leap
-        return self[*idx]
+        if i < 0: i += self.size
+        if not 0 <= i < self.size: raise IndexError("index out of range")
+        pos = self.offset
+        for n, s in zip(reversed(self.dim), reversed(self.strides)):
+            i, r = divmod(i, n)
+            pos += r*s
+        return self._item(pos)
 
-    def __add__(self, other):
-        return NDarray.dispatch(self, other, add)
+    def _item(self, pos):
+        return bool(self.buf[pos]) if self.dtype is bool_ else self.buf[pos]
+
+    def broadcast_to(self, shape):
+        pad = len(shape) - len(self.dim)
+        assert pad >= 0, "Cannot broadcast to fewer dimensions"
+        strides = [0] * pad
+        for n, m, s in zip(self.dim, shape[pad:], self.strides):
+            assert n in (1, m), "Dimension mismatch"
+            strides.append(s if n == m else 0)
+        return NDarray.from_buffer(self.buf, shape, tuple(strides), self.offset)
+
+    def view(self, idx):
+        dim, strides, offset = [], [], self.offset
+        idx = (*idx, *(slice(None) for _ in self.dim[len(idx):]))
+        for i, n, s in zip(idx, self.dim, self.strides):
+            if isinstance(i, slice):
+                start, stop, step = i.indices(n)
+                dim.append(len(range(start, stop, step)))
+                strides.append(s*step)
+                offset += start*s
+            else:
+                if i < 0: i += n
+                if not 0 <= i < n: raise IndexError("index out of range")
+                offset += i*s
+        return NDarray.from_buffer(self.buf, dim, tuple(strides), offset)
+
+    def copy(self):
+        return NDarray.from_buffer(array(typecode(self.buf), self), self.dim)
 
     def reshape(self, shape):
-        return NDarray.with_shape(self, shape)
+        shape = tuple(shape)
+        if -1 in shape:
+            known = -product(shape)
+            shape = tuple(self.size // known if n == -1 else n for n in shape)
+        assert product(shape) == self.size, "Size mismatch"
+        src = self if self.contiguous else self.copy()
+        return NDarray.from_buffer(src.buf, shape, offset=src.offset)
+
+    def transpose(self, *axes):
+        if len(axes) == 1 and isinstance(axes[0], tuple): axes, = axes
+        axes = axes or tuple(reversed(range(len(self.dim))))
+        assert sorted(axes) == list(range(len(self.dim))), "Axes should be a permutation"
+        return NDarray.from_buffer(self.buf, (self.dim[a] for a in axes),
+                                   tuple(self.strides[a] for a in axes), self.offset)
+
+    def swapaxes(self, a, b):
+        axes = list(range(len(self.dim)))
+        axes[a], axes[b] = axes[b], axes[a]
+        return self.transpose(*axes)
+
+    @property
+    def T(self):
+        return self.transpose()
+
+    def _axis(self, axis):
+        if not -len(self.dim) <= axis < len(self.dim):
+            raise IndexError(f"axis {axis} is out of bounds for {len(self.dim)} dimensions")
+        return axis % len(self.dim)
+
+    def _along(self, axis):
+        axis = self._axis(axis)
+        perm = (*(a for a in range(len(self.dim)) if a != axis), axis)
+        return axis, self.transpose(*perm)
+
+    # `combine` merges the results of `f` on parts of the array, allowing it to run in parallel
+    def reduce(self, f, axis=None, keepdims=False, combine=None):
+        if axis is None:
+            if combine and self.dim and run_parallel(self.size):
+                res = combine(in_processes(lambda start, stop: f(span_of(self, start, stop)), self.size))
+            else:
+                res = f(iter(self))
+            return NDarray.from_buffer(to_buffer([res]), (1,) * len(self.dim)) if keepdims else res
+        axis, moved = self._along(axis)
+        dim = moved.dim[:-1]
+        rows = lambda start, stop: map(f, lanes(moved.buf, moved.dim, moved.strides, moved.offset, range(start, stop)))
+        if run_parallel(self.size) and product(dim) > 1:
+            res = in_processes(rows, product(dim), infer=True)
+        else:
+            res = to_buffer(rows(0, product(dim)))
+        if keepdims: dim = (*dim[:axis], 1, *dim[axis:])
+        elif not dim: return res[0]
+        return NDarray.from_buffer(res, dim)
+
+    def sum(self, axis=None, keepdims=False): return self.reduce(sum, axis, keepdims, sum)
+    def prod(self, axis=None, keepdims=False): return self.reduce(product, axis, keepdims, product)
+    def min(self, axis=None, keepdims=False): return self.reduce(min, axis, keepdims, min)
+    def max(self, axis=None, keepdims=False): return self.reduce(max, axis, keepdims, max)
+
+    def mean(self, axis=None, keepdims=False):
+        return self.sum(axis, keepdims) / (self.size if axis is None else self.dim[self._axis(axis)])
+
+    def argmax(self, axis=None, keepdims=False):
+        return self.reduce(lambda it: max(enumerate(it), key=operator.itemgetter(1))[0], axis, keepdims)
+
+    def cumsum(self, axis=None):
+        if axis is None:
+            return NDarray.from_buffer(to_buffer(accumulate(self)), (self.size,))
+        axis, moved = self._along(axis)
+        res = chain.from_iterable(map(accumulate, lanes(moved.buf, moved.dim, moved.strides, moved.offset)))
+        last = len(self.dim) - 1
+        return NDarray.from_buffer(to_buffer(res), moved.dim).transpose(*range(axis), last, *range(axis, last))
+
+    # header: magic, typecode, ndim, shape and strides (in elements), then little-endian data
+    def save(self, path):
+        tc = typecode(self.buf)
+        with open(path, "wb") as f:
+            f.write(struct.pack(f"<4scB2x{2*len(self.dim)}q", MAGIC, tc.encode(), len(self.dim),
+                                *self.dim, *contiguous_strides(self.dim)))
+            if self.contiguous and sys.byteorder == "little":
+                f.write(memoryview(self.buf)[self.offset:self.offset + self.size])
+                return
+            for lane in (lanes(self.buf, self.dim, self.strides, self.offset) if self.dim else [[self[()]]]):
+                data = array(tc, lane)
+                if sys.byteorder == "big": data.byteswap()
+                data.tofile(f)
+
+    @staticmethod
+    def load(path, mmap=True):
+        with open(path, "rb") as f:
+            magic, tc, ndim = struct.unpack("<4scB2x", f.read(8))
+            assert magic == MAGIC, "Not an NDarray file"
+            dims = struct.unpack(f"<{2*ndim}q", f.read(16*ndim))
+            tc, start = tc.decode(), 8 + 16*ndim
+            if mmap and sys.byteorder == "little":
+                buf = memoryview(_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ))[start:].cast(tc)
+            else:
+                buf = array(tc, f.read())
+                if sys.byteorder == "big": buf.byteswap()
+        return NDarray.from_buffer(buf, dims[:ndim], dims[ndim:])
+
+    def __matmul__(self, other):
+        return NDarray.matmul(self, other)
+
+    def __rmatmul__(self, other):
+        return NDarray.matmul(other, self)
+
+    def dot(self, other):
+        other = asarray(other)
+        if not self.dim or not other.dim: return self * other
+        if len(other.dim) <= 2: return self @ other
+        return NDarray.tensordot(self, other, ([-1], [-2]))
+
+    @staticmethod
+    def matmul(a, b, workers=None):
+        a, b = asarray(a), asarray(b)
+        assert a.dim and b.dim, "Scalars cannot be matrix multiplied"
+        a2 = a.reshape((1, *a.dim)) if len(a.dim) == 1 else a
+        b2 = b.reshape((*b.dim, 1)) if len(b.dim) == 1 else b
+        (n, k), (kb, m) = a2.dim[-2:], b2.dim[-2:]
+        assert k == kb, "Dimension mismatch"
+        batch = NDarray.expanded_shape(a2.dim[:-2], b2.dim[:-2])
+        a2, b2 = a2.broadcast_to((*batch, n, k)), b2.broadcast_to((*batch, kb, m))
+        out = []
+        for idx in indices(*map(range, batch)):
+            out += matmul2d(a2[idx], b2[idx], workers)
+        dim = (*batch, *a.dim[-2:-1], *(b.dim[-1:] if len(b.dim) > 1 else ()))
+        res = NDarray.from_buffer(to_buffer(out, arithmetic(a, b), wrap=True), dim)
+        return res if dim else res[()]
+
+    @staticmethod
+    def tensordot(a, b, axes=2, workers=None):
+        a, b = asarray(a), asarray(b)
+        if isinstance(axes, int):
+            axes = range(len(a.dim) - axes, len(a.dim)), range(axes)
+        sum_a, sum_b = [a._axis(x) for x in axes[0]], [b._axis(x) for x in axes[1]]
+        free_a = [x for x in range(len(a.dim)) if x not in sum_a]
+        free_b = [x for x in range(len(b.dim)) if x not in sum_b]
+        k = product(a.dim[x] for x in sum_a)
+        assert [a.dim[x] for x in sum_a] == [b.dim[x] for x in sum_b], "Dimension mismatch"
+        dim = (*(a.dim[x] for x in free_a), *(b.dim[x] for x in free_b))
+        a2 = a.transpose(*free_a, *sum_a).reshape((product(a.dim[x] for x in free_a), k))
+        b2 = b.transpose(*sum_b, *free_b).reshape((k, product(b.dim[x] for x in free_b)))
+        res = NDarray.from_buffer(to_buffer(matmul2d(a2, b2, workers), arithmetic(a, b), wrap=True), dim)
+        return res if dim else res[()]
 
     @staticmethod
     def shape(arr):
@@ -48,45 +478,143 @@ class NDarray:
 
     @staticmethod
     def with_shape(arr, shape):
-        def _with_shape(g, shape):
-            if not shape: return next(g)
-            return [_with_shape(g, shape[1:]) for _ in range(shape[0])]
-        return NDarray(_with_shape(iter(arr), shape))
+        return NDarray.from_buffer(to_buffer(arr), shape)
 
     @staticmethod
-    def dispatch(arr1, arr2, f):
-        flat_res = []
-        for id1, id2 in NDarray.expanded_dispatch_indices(arr1.dim, arr2.dim):
-            l,r = arr1[id1], arr2[id2]
-            flat_res.append(f(l,r))
-        return NDarray.with_shape(flat_res, NDarray.expanded_shape(arr1.dim, arr2.dim))
+    def dispatch(arr1, arr2, f, out=None, dtype=None):
+        return NDarray.apply(f, arr1, arr2, out=out, dtype=dtype)
 
     @staticmethod
-    def expanded_dispatch_indices(shape1, shape2):
-        assert len(shape1) == len(shape2), "Dimensionallity should match"
+    def apply(f, *arrs, out=None, dtype=None):
+        arrs = list(map(asarray, arrs))
+        shape = NDarray.expanded_shape(*(a.dim for a in arrs))
+        views = [a.broadcast_to(shape) for a in arrs]
+        if out is None and shape and run_parallel(product(shape)):
+            task = lambda start, stop: map(f, *(span_of(v, start, stop) for v in views))
+            buf = in_processes(task, product(shape), dtypes.get(dtype, dtype), infer=dtype is None)
+            return NDarray.from_buffer(buf, shape)
+        res = map(f, *views)
+        if out is None:
+            return NDarray.from_buffer(to_buffer(res, dtype, wrap=True), shape)
+        assert out.dim == shape, "Output shape mismatch"
+        res = to_buffer(res, typecode(out.buf), wrap=True)
+        if out.contiguous:
+            out.buf[out.offset:out.offset + out.size] = res
+        else:
+            for p, x in zip(flat_positions(out.dim, out.strides, out.offset), res): out.buf[p] = x
+        return out
 
-        def rdispatch(shape, shape1, shape2):
-            if len(shape) == 0:
-                yield tuple(), tuple()
-            else:
-                for i in range(shape[0]):
-                    id1 = 0 if shape1[0] == 1 else i
-                    id2 = 0 if shape2[0] == 1 else i
-                    for ids1, ids2 in rdispatch(shape[1:], shape1[1:], shape2[1:]):
-                        yield (id1, *ids1), (id2, *ids2)
-        
-        yield from rdispatch(NDarray.expanded_shape(shape1, shape2), shape1, shape2)
+    @staticmethod
+    def expanded_shape(*shapes):
+        ndim = max(map(len, shapes))
+        shapes = [(1,) * (ndim - len(s)) + tuple(s) for s in shapes]
+        dim = []
+        for ns in zip(*shapes):
+            n = next((m for m in ns if m != 1), 1)
+            assert all(m in (1, n) for m in ns), "Dimension mismatch"
+            dim.append(n)
+        return tuple(dim)
+
+
+# a deferred elementwise expression; eval() fuses the whole graph into one pass over the output
+class Lazy:
+    def __init__(self, op, args, dtype):
+        self.op, self.args, self.dtype = op, args, dtype
+
+    def eval(self):
+        leaves, temps, program = {}, {}, []
+        is_node = lambda a: isinstance(a, Lazy) and a.op != "leaf"
+        def ref(a):
+            if is_node(a): return ("t", temps[id(a)])
+            leaf = a.args[0] if isinstance(a, Lazy) else a
+            return ("x", leaves.setdefault(id(leaf), (len(leaves), leaf))[0])
+        # each node becomes one step once its operands have, walking the graph with an explicit stack
+        stack = [self] if is_node(self) else []
+        while stack:
+            node = stack[-1]
+            if id(node) in temps:
+                stack.pop()
+                continue
+            pending = [a for a in node.args if is_node(a) and id(a) not in temps]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            temps[id(node)] = len(program)
+            program.append((node.op, node.dtype, *map(ref, node.args)))
+        kernel = fuse(tuple(program), ref(self), len(leaves))
+        return NDarray.apply(kernel, *(leaf for _, leaf in leaves.values()), dtype=self.dtype)
 
     @staticmethod
-    def expanded_shape(shape1, shape2):
-        assert len(shape1) == len(shape2), "Dimensionallity should match"
-        if len(shape1) == 0:
-            return tuple()
-        elif shape1[0] == shape2[0] or shape2[0] == 1:
-            return (shape1[0], *NDarray.expanded_shape(shape1[1:], shape2[1:]))
-        elif shape1[0] == 1:
-            return (shape2[0], *NDarray.expanded_shape(shape1[1:], shape2[1:]))
-        assert False, "Dimension mismatch"
+    def node(op, rule, *args):
+        return Lazy(op, args, rule(*args))
+
+def lazy(a):
+    return Lazy("leaf", (asarray(a),), asarray(a).dtype)
+
+NDarray.lazy = property(lazy)
+
+SYMBOLS = {"add": "+", "sub": "-", "mul": "*", "truediv": "/", "pow": "**", "mod": "%", "floordiv": "//",
+           "lt": "<", "le": "<=", "gt": ">", "ge": ">=", "eq": "==", "ne": "!=", "neg": "-", "pos": "+"}
+
+# compile the steps of an expression into one function over its leaves, assigning every step
+# (shared or not) to its own temporary so the source stays flat however long the chain is.
+# Integer steps wrap around their dtype's range as they do eagerly, where each step is stored.
+@lru_cache(maxsize=256)
+def fuse(program, result, nleaves):
+    env, lines = {}, []
+    for k, (op, dtype, *args) in enumerate(program):
+        args = [f"{kind}{i}" for kind, i in args]
+        if callable(op):
+            env[f"f{k}"] = op
+            lines.append(f"t{k} = f{k}({', '.join(args)})")
+        elif len(args) == 1: lines.append(f"t{k} = {SYMBOLS[op]}{args[0]}")
+        else: lines.append(f"t{k} = {args[0]} {SYMBOLS[op]} {args[1]}")
+        if dtype.kind is int:
+            half = 1 << (8*dtype.itemsize - 1)
+            lines.append(f"if not -{half} <= t{k} < {half}: t{k} = (t{k} + {half}) % {2*half} - {half}")
+    lines.append(f"return {result[0]}{result[1]}")
+    exec(f"def fused({', '.join(f'x{i}' for i in range(nleaves))}):\n    " + "\n    ".join(lines), env)
+    return env["fused"]
+
+# `rule` picks the result dtype from the operands, otherwise it is inferred from the results
+def vectorize(f, rule=None):
+    def vectorized(*arrs, out=None):
+        if any(isinstance(a, Lazy) for a in arrs): return Lazy.node(f, rule or floating, *arrs)
+        return NDarray.apply(f, *arrs, out=out, dtype=rule and rule(*arrs))
+    return vectorized
+
+abs_, neg = vectorize(abs, arithmetic), vectorize(operator.neg, arithmetic)
+sqrt, exp, log, sin, cos, tan, floor, ceil = (vectorize(f, floating) for f in
+    (math.sqrt, math.exp, math.log, math.sin, math.cos, math.tan, math.floor, math.ceil))
+
+def binary(name, rule, reflected=False):
+    f = getattr(operator, name)
+    def eager(self, other):
+        if isinstance(other, Lazy): return NotImplemented
+        l, r = (other, self) if reflected else (self, other)
+        return NDarray.dispatch(l, r, f, dtype=rule(l, r))
+    def deferred(self, other):
+        l, r = (other, self) if reflected else (self, other)
+        return Lazy.node(name, rule, l, r)
+    return eager, deferred
+
+for _name, _rule in [("add", arithmetic), ("sub", arithmetic), ("mul", arithmetic), ("truediv", floating),
+                     ("pow", arithmetic), ("mod", arithmetic), ("floordiv", arithmetic)]:
+    for _dunder, _reflected in [(f"__{_name}__", False), (f"__r{_name}__", True)]:
+        _eager, _deferred = binary(_name, _rule, _reflected)
+        setattr(NDarray, _dunder, _eager)
+        setattr(Lazy, _dunder, _deferred)
+    setattr(NDarray, f"__i{_name}__", lambda self, other, f=getattr(operator, _name): NDarray.dispatch(self, other, f, self))
+for _name in ["lt", "le", "gt", "ge", "eq", "ne"]:
+    _eager, _deferred = binary(_name, comparison)
+    setattr(NDarray, f"__{_name}__", _eager)
+    setattr(Lazy, f"__{_name}__", _deferred)
+NDarray.__neg__, NDarray.__abs__, NDarray.__pos__ = neg, abs_, vectorize(operator.pos)
+Lazy.__neg__ = lambda self: Lazy.node("neg", arithmetic, self)
+Lazy.__pos__ = lambda self: Lazy.node("pos", arithmetic, self)
+Lazy.__abs__ = lambda self: Lazy.node(abs, arithmetic, self)
+NDarray.__hash__ = Lazy.__hash__ = None
 
 
 # Some tests
@@ -110,3 +638,135 @@ if __name__ == "__main__":
     assert (nda([1,2]).reshape((2,1)) + nda([1,2]).reshape((1,2))).arr == [[2, 3], [3, 4]], \
             "Dispatch on expanded nd-arrays should work"
 
+    assert nda(arr).strides == (6,3,1), "Strides should be row-major"
+    assert nda(arr).buf.itemsize == 8, "Elements should be stored unboxed"
+    assert nda(arr).arr == arr, "Nested view should round-trip"
+    assert nda(arr)[-1, 0, -1] == 21, "Negative indexing should work"
+    assert nda(arr)[-1] == 24, "Negative flattened indexing should work"
+    assert nda([[0.5, 1]]).arr == [[0.5, 1.0]], "Mixed numbers should be stored as floats"
+    assert nda([2**70]).arr == [2.0**70] and nda([[2**40, 2**40]]).prod(axis=1).arr == [2.0**80], \
+            "Integers beyond int64 should be stored as floats"
+    try: nda([2**70], dtype="int64"); assert False, "Explicit dtypes should not widen"
+    except OverflowError as e: assert "int64" in str(e), "Overflow errors should name the dtype"
+
+    a = nda(arr)
+    assert a.reshape((6,4)).buf is a.buf, "Reshaping a contiguous array should be a view"
+    assert a.reshape((-1,4)).dim == (6,4), "Reshaping should infer a -1 dimension"
+    assert a[1:3, :, ::2].arr == [[[7, 9], [10, 12]], [[13, 15], [16, 18]]], "Slicing should work"
+    assert a[1:3, :, ::2].buf is a.buf, "Slicing should be a view"
+    assert a[::-1, 1].arr == [[22,23,24], [16,17,18], [10,11,12], [4,5,6]], "Mixed index and slice should work"
+    assert a[2:].dim == (2,2,3), "Missing indices should select whole axes"
+    assert a.transpose().dim == (3,2,4) and a.T[2,1,3] == a[3,1,2], "Transposing should work"
+    assert a.swapaxes(0, 2)[1, 0, 3] == a[3, 0, 1], "Swapping axes should work"
+    assert a.T.reshape((24,)).arr == [a.T[i] for i in range(24)], "Non-contiguous reshape should copy"
+    assert a.T.reshape((24,)).buf is not a.buf, "Non-contiguous reshape should copy"
+
+    assert (nda([1,2]) + nda([[10],[20]])).arr == [[11,12],[21,22]], "Dispatch should pad leading axes"
+    assert (nda([1,2,3]) * 2).arr == [2,4,6] and (10 - nda([1,2])).arr == [9,8], "Scalars should broadcast"
+    assert (nda([3,4]) ** 2 % 5).arr == [4,1] and (nda([7]) // 2).arr == [3], "Arithmetic should work"
+    assert (nda([1,2,3]) < 2).arr == [True,False,False], "Comparisons should work"
+    assert (-nda([1,-2])).arr == [-1,2] and abs(nda([-1])).arr == [1], "Unary operators should work"
+    assert sqrt(nda([4,9])).arr == [2.0,3.0], "Math functions should work"
+    b = nda([[1,2],[3,4]]); v = b
+    b += nda([10,20])
+    assert v is b and b.arr == [[11,22],[13,24]], "In-place dispatch should write into the buffer"
+    bt = b.T; bt *= 2
+    assert b.arr == [[22,44],[26,48]], "In-place dispatch should write through views"
+
+    a = nda(arr)
+    assert a.sum() == 300 and a.prod() == product(range(1, 25)), "Full reductions should work"
+    assert a.sum(axis=0).arr == [[40,44,48],[52,56,60]], "Reducing the first axis should work"
+    assert a.sum(axis=-1).arr == [[6,15],[24,33],[42,51],[60,69]], "Reducing the last axis should work"
+    assert a.max(axis=1, keepdims=True).dim == (4,1,3), "Keeping dimensions should work"
+    assert a.min() == 1 and a.T.max(axis=0).arr == [[3,9,15,21],[6,12,18,24]], "Min and max should work"
+    assert nda([1,2,3,4]).mean() == 2.5 and nda([[1,2],[3,5]]).mean(axis=0).arr == [2.0,3.5], "Mean should work"
+    assert nda([3,9,2]).argmax() == 1 and nda([[1,5],[7,2]]).argmax(axis=1).arr == [1,0], "Argmax should work"
+    assert nda([1,2,3]).sum(axis=0) == 6, "Reducing to zero dimensions should give a scalar"
+    assert nda([[1,2],[3,4]]).cumsum().arr == [1,3,6,10], "Flat cumulative sum should work"
+    assert nda([[1,2],[3,4]]).cumsum(axis=0).arr == [[1,2],[4,6]], "Cumulative sum along an axis should work"
+    assert a.cumsum(axis=1)[3,1,2] == 45, "Cumulative sum along a middle axis should work"
+    assert nda([[1,2],[3,5]]).mean(axis=-2).arr == [2.0,3.5], "Negative axes should work"
+    for reduce, axis in [(nda([[1,2]]).sum, 3), (nda([[1,2]]).mean, 2), (nda([[1,2]]).cumsum, -3), (nda(1).mean, 0)]:
+        try: reduce(axis=axis); assert False, f"Axis {axis} should be out of bounds"
+        except IndexError: pass
+
+    import tempfile
+    m = nda([[1,2,3],[4,5,6]])
+    assert (m @ nda([[1,0],[0,1],[1,1]])).arr == [[4,5],[10,11]], "Matrix multiplication should work"
+    assert (m @ m.T).arr == [[14,32],[32,77]], "Matrix multiplication of views should work"
+    assert (m @ nda([1,1,1])).arr == [6,15] and nda([1,2]) @ nda([3,4]) == 11, "Vector products should work"
+    assert (nda([m.arr, m.arr]) @ m.T).dim == (2,2,2), "Batched multiplication should broadcast"
+    assert (nda([[[1,0],[0,1]]]) @ nda([[[1,2]],[[3,4]]]).reshape((2,2,1))).arr == [[[1],[2]],[[3],[4]]], \
+            "Batch dimensions should broadcast against each other"
+    assert m.dot(m.T).arr == (m @ m.T).arr and m.dot(2).arr == (m * 2).arr, "Dot should work"
+    assert nda.tensordot(a, a, 3) == sum(x*x for x in a), "Full tensor contraction should work"
+    assert nda.tensordot(a, nda([1,1,1]), ([2], [0])).arr == a.sum(axis=2).arr, "Tensor contraction should work"
+    f32 = nda([[1, 2], [3, 4]], dtype=float32)
+    assert (f32 @ f32).dtype is float32 and nda.tensordot(f32, f32, 1).dtype is float32, "Products should promote like *"
+    assert (nda([[2**62, 0]]) @ nda([[4], [0]])).arr == [[0]], "Integer products should wrap like *"
+    try: nda.tensordot(m, m.T, ([3], [0])); assert False, "Out-of-range axes should be rejected"
+    except IndexError: pass
+    big = nda([[i + j for j in range(150)] for i in range(130)])
+    assert nda.matmul(big, big.T, workers=4).arr == nda.matmul(big, big.T, workers=1).arr, \
+            "Threaded multiplication should agree with the serial one"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        a.save(f"{tmp}/a.nda"); a.T[1:].save(f"{tmp}/t.nda"); nda(7.5).save(f"{tmp}/s.nda")
+        assert nda.load(f"{tmp}/a.nda").arr == a.arr, "Saved arrays should load"
+        assert isinstance(nda.load(f"{tmp}/a.nda").buf, memoryview), "Loading should memory-map"
+        assert nda.load(f"{tmp}/a.nda", mmap=False).arr == a.arr, "Loading into memory should work"
+        assert nda.load(f"{tmp}/t.nda").arr == a.T[1:].arr, "Saving views should work"
+        assert nda.load(f"{tmp}/s.nda")[()] == 7.5, "Saving scalars should work"
+        assert (nda.load(f"{tmp}/a.nda")[1:3, 0] + 1).sum() == 72, "Memory-mapped arrays should compute"
+
+    f = nda([[1.5, 2], [3, 4]], dtype=float32)
+    assert f.dtype is float32 and f.nbytes == 16, "Explicit dtypes should be stored compactly"
+    assert (f < 3).dtype is bool_ and (f < 3).nbytes == 4, "Masks should be stored as bytes"
+    assert (f < 3).arr == [[True, True], [False, False]] and (f < 3)[0, 0] is True, "Masks should read as bools"
+    assert (f * 2).dtype is float32 and (f + nda([1])).dtype is float64, "Dtypes should promote"
+    assert (nda([1], dtype="int8") + nda([1], dtype=int32)).dtype is int32, "Integer dtypes should promote"
+    assert (nda([1, 2]) / 2).dtype is float64 and (nda([True]) + True).dtype is int64, "Division and bools should promote"
+    assert nda([1.7, -2.2]).astype(int8).arr == [1, -2] and nda([0, 2]).astype(bool_).arr == [False, True], \
+            "Conversion should work"
+    assert (nda([100], dtype=int8) * 2).arr == [-56] and (nda([2**62]) * 4).arr == [0], \
+            "Integer arithmetic should wrap around its dtype"
+    w = nda([120, 1], dtype=int8); w += 10
+    assert w.arr == [-126, 11] and nda([300]).astype(int8).arr == [44], "Stores into small dtypes should wrap"
+    assert nda([True, False]).sum() == 1 and (nda([1, 2]) == nda([1, 3])).dtype is bool_, "Masks should compute"
+
+    big = nda([[i * j % 7 for j in range(60)] for i in range(50)])
+    with parallel(3, threshold=100):
+        assert (big * 2 + big.T.T).arr == (big * 3).arr, "Parallel dispatch should agree with serial"
+        assert nda.apply(lambda x: x / 2, big).arr == [[x / 2 for x in row] for row in big.arr], \
+                "Parallel dispatch should infer float results"
+        assert nda.apply(lambda x: x > 2, big).dtype is bool_ and nda.apply(lambda x: x > 2, big).sum() == \
+                sum(x > 2 for x in big), "Parallel dispatch should infer bool results like serial"
+        mixed = nda.apply(lambda x: x or True, big)
+        assert mixed.dtype is int64 and mixed.arr == [[x or 1 for x in row] for row in big.arr], \
+                "Results that start as bools should widen to int64 like serial"
+        assert (big < 3).dtype is bool_ and (big < 3).sum() == sum(x < 3 for x in big), "Parallel masks should work"
+        assert big.sum() == sum(big) and big.T.max() == 6, "Parallel reductions should work"
+        assert (big.astype(int8) * 40).arr == [[(x * 40 + 128) % 256 - 128 for x in row] for row in big.arr], \
+                "Parallel dispatch should wrap like serial"
+        assert big.sum(axis=0).arr == [sum(row[j] for row in big.arr) for j in range(60)], \
+                "Parallel axis reductions should work"
+
+    a, b, c = nda([1, 2, 3]), nda([[1], [2]]), nda([0.5, 1, 2], dtype=float32)
+    expr = (a.lazy + b) * c + 1
+    assert isinstance(expr, Lazy) and expr.dtype is float64, "Operators on lazy arrays should build expressions"
+    assert expr.eval().arr == ((a + b) * c + 1).arr, "Fused evaluation should agree with eager evaluation"
+    small = nda([100, -3], dtype=int8)
+    assert (small.lazy * 2 < 0).eval().arr == (small * 2 < 0).arr == [True, True] and \
+            (small.lazy * 2 // 3).eval().arr == (small * 2 // 3).arr == [-19, -2], "Fused steps should wrap like eager ones"
+    hits = fuse.cache_info().hits
+    assert ((a.lazy + b) * c + 1).eval().dim == (2, 3) and fuse.cache_info().hits == hits + 1, \
+            "Fused kernels should be cached by expression shape"
+    e = a.lazy * 2
+    assert (e + e).eval().arr == [4, 8, 12] and (-e < -3).eval().arr == [False, True, True], \
+            "Shared subexpressions should work"
+    assert sqrt(abs(a.lazy - 5)).eval().arr == [2.0, math.sqrt(3), math.sqrt(2)], "Math functions should fuse"
+    assert (2 ** lazy([1, 2])).eval().arr == [2, 4], "Reflected operators should work"
+    assert a.lazy.eval().arr == [1, 2, 3], "A bare leaf should evaluate to itself"
+    chained = a.lazy
+    for i in range(3000): chained = chained * 1 if i % 2 else chained + 1
+    assert chained.eval().arr == [1501, 1502, 1503], "Long chains should fuse without nesting"
@@ -0,0 +1,29 @@
+#!/bin/env python3
+import sys, time
+from random import random
+from nda import NDarray
+
+def naive(a, b, rows):
+    n, m = len(b), len(b[0])
+    return [[sum(a[i][p] * b[p][j] for p in range(n)) for j in range(m)] for i in range(rows)]
+
+def timed(f):
+    t = time.perf_counter()
+    f()
+    return time.perf_counter() - t
+
+sizes = list(map(int, sys.argv[1:])) or [256, 1024]
+for n in sizes:
+    a = [[random() for _ in range(n)] for _ in range(n)]
+    b = [[random() for _ in range(n)] for _ in range(n)]
+    A, B = NDarray(a), NDarray(b)
+
+    rows = min(n, 32) # the triple loop is timed on a few rows and scaled up
+    t_naive = timed(lambda: naive(a, b, rows)) * n / rows
+    t_serial = timed(lambda: NDarray.matmul(A, B, workers=1))
+    t_threads = timed(lambda: NDarray.matmul(A, B))
+
+    print(f"{n}x{n}")
+    print(f"  naive triple loop: {t_naive:8.2f}s" + (" (scaled from %d rows)" % rows if rows < n else ""))
+    print(f"  blocked:           {t_serial:8.2f}s  ({t_naive / t_serial:.0f}x)")
+    print(f"  blocked, threaded: {t_threads:8.2f}s  ({t_naive / t_threads:.0f}x)")
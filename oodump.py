@@ -0,0 +1,94 @@
+import io, re
+from collections.abc import Iterator
+
+FLUSH = 1 << 12 # pieces buffered between writes to the file
+
+ESCAPE = re.compile(r'["\\\x00-\x1f]')
+ESCAPES = {**{chr(c): f"\\u{c:04x}" for c in range(32)},
+           '"': '\\"', "\\": "\\\\", "\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+TABLE = str.maketrans(ESCAPES)
+
+def string(s): return '"' + (s.translate(TABLE) if ESCAPE.search(s) else s) + '"'
+
+def number(x):
+    if x != x: return "NaN"
+    if x in (float("inf"), float("-inf")): return "Infinity" if x > 0 else "-Infinity"
+    return float.__repr__(x)
+
+def scalar(x):
+    if isinstance(x, str): return string(x)
+    if x is None: return "null"
+    if x is True: return "true"
+    if x is False: return "false"
+    if isinstance(x, int): return int.__repr__(x)
+    if isinstance(x, float): return number(x)
+    raise TypeError(f"Object of type {type(x).__name__} is not JSON serializable")
+
+def key(k):
+    if isinstance(k, str): return string(k)
+    if k is None or isinstance(k, (int, float)): return '"' + scalar(k) + '"'
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(k).__name__}")
+
+# Writes obj as json to fp in chunks, with the same output as json.dump(obj, fp, ensure_ascii=False).
+# Arrays may also come from tuples or any iterator (generators included), which are consumed lazily,
+# so memory is bounded by the nesting depth and FLUSH, not by the size of the document.
+def dump(obj, fp):
+    out, write = [], fp.write
+    stack, open_ids = [(iter((obj,)), "", False, None)], set()
+    first = True
+    while stack:
+        items, close, keyed, ident = stack[-1]
+        for x in items:
+            if not first: out.append(", ")
+            first = False
+            if keyed:
+                k, x = x
+                out.append(key(k) + ": ")
+            t = type(x)
+            if t is str: out.append(string(x))
+            elif t is int: out.append(int.__repr__(x))
+            elif t is dict or t is list or t is tuple or isinstance(x, (dict, list, tuple, Iterator)):
+                if id(x) in open_ids: raise ValueError("Circular reference detected")
+                open_ids.add(id(x))
+                if isinstance(x, dict): out.append("{"); stack.append((iter(x.items()), "}", True, id(x)))
+                else: out.append("["); stack.append((iter(x), "]", False, id(x)))
+                first = True
+                break
+            else: out.append(scalar(x))
+            if len(out) >= FLUSH:
+                write("".join(out))
+                out.clear()
+        else:
+            stack.pop()
+            open_ids.discard(ident)
+            out.append(close)
+            first = False
+    write("".join(out))
+
+def dumps(obj):
+    fp = io.StringIO()
+    dump(obj, fp)
+    return fp.getvalue()
+
+
+if __name__ == "__main__":
+    import json
+    doc = {"a": [1, -2.5, 1e100, True, None], "b": {"c": 'q"\\\n\x01å😀'}, "": [], "d": {}, 3: (1, 2), None: 0.1}
+    assert dumps(doc) == json.dumps(doc, ensure_ascii=False), "Output should match json.dumps"
+    assert dumps(float("nan")) == "NaN" and dumps([float("-inf")]) == "[-Infinity]", "Non-finite floats should match json"
+    assert dumps(x * x for x in range(4)) == "[0, 1, 4, 9]", "Generators should be written as arrays"
+    assert dumps({"xs": iter([{"n": i} for i in range(2)])}) == '{"xs": [{"n": 0}, {"n": 1}]}', "Iterators should nest"
+    deep = []
+    for _ in range(10000): deep = [deep]
+    assert dumps(deep) == "[" * 10001 + "]" * 10001, "Nesting should not be limited by the stack"
+    fp = io.StringIO()
+    dump(range(100000).__iter__(), fp)
+    assert json.loads(fp.getvalue()) == list(range(100000)), "Long streams should be written in chunks"
+    for bad in [{1j: 1}, [object()]]:
+        try: dumps(bad)
+        except TypeError: continue
+        assert False, f"{bad} should be rejected"
+    loop = []
+    loop.append(loop)
+    try: dumps(loop); assert False, "Cycles should be rejected"
+    except ValueError: pass
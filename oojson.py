@@ -1,3 +1,14 @@
+from collections import OrderedDict
+from itertools import count
+from types import MethodWrapperType
+import re
+
+MEMO_SIZE = 1 << 16 # results kept by the packrat cache, least recently used are evicted first
+_memo, _memo_input = OrderedDict(), None
+
+fst = lambda x, _: x
+snd = lambda _, y: y
+
 def foldl(f, xs):
     assert xs
     match xs:
@@ -5,59 +16,263 @@ def foldl(f, xs):
         case [*xs, x]: return f(foldl(f, xs), x)
 
 class P:
-    def __init__(self, p):
-        self.p = p
+    lookahead = True # let alternatives pick candidates from the next character
+
+    def __init__(self, p, first=None, empty=False, node=None):
+        self.p = p # p(s, i) -> (x, j) or None, where j is the position after x
+        self.first = first # holds for the next character whenever p succeeds, None if unknown
+        self.empty = empty # p always succeeds without consuming anything
+        self.node = node # how p was built, as (kind, *args), for `compile`
+        self.compiled = None
 
-    def __call__(self, s): return self.p(s)
+    def __call__(self, s, i=0): return self.p(s, i)
 
     def __rmatmul__(self, f):
-        return P(lambda s:
-            (f(r[0]), r[1]) if (r := self(s)) else None)
+        return P(lambda s, i:
+            (f(r[0]), r[1]) if (r := self(s, i)) else None, self.first, self.empty, ("map", f, self))
 
     def __and__(self, p):
-        return P(lambda s:
-            (r[0] @ p)(r[1]) if (r := self(s)) else None)
+        return P(lambda s, i:
+            (r[0](q[0]), q[1]) if (r := self(s, i)) and (q := p(s, r[1])) else None,
+            p.first if self.empty else self.first, self.empty and p.empty, ("ap", self, p))
 
-    def __or__(self, p): return P(lambda s: self(s) or p(s))
+    def __or__(self, p): return P.oneof(*getattr(self, "alts", [self]), p)
 
-    def __lt__(self, p): return P.liftA2(lambda x,_: x)(self, p)
+    @staticmethod
+    def oneof(*alts):
+        table = {}
+        def r(s, i):
+            if not P.lookahead: return next(filter(None, (p(s, i) for p in alts)), None)
+            c = s[i] if i < len(s) else ""
+            if (ps := table.get(c)) is None:
+                ps = table[c] = [p for p in alts if p.first is None or c and p.first(c)]
+            for p in ps:
+                if m := p(s, i): return m
+            return None
+        first = None if any(p.first is None for p in alts) else lambda c: any(p.first(c) for p in alts)
+        q = P(r, first, node=("alt", alts))
+        q.alts = alts
+        return q
+
+    def __lt__(self, p): return P.liftA2(fst)(self, p)
 
-    def __gt__(self, p): return P.liftA2(lambda _,y: y)(self, p)
+    def __gt__(self, p): return P.liftA2(snd)(self, p)
 
     @property
     def many(self):
-        def r(s):
-            match self(s):
-                case x, rs:
-                    l, rrs = r(rs)
-                    return [x] + l, rrs
-            return ([], s)
-        return P(r)
+        def r(s, i):
+            xs = []
+            while (m := self(s, i)) and m[1] != i:
+                xs.append(m[0])
+                i = m[1]
+            return xs, i
+        return P(r, node=("many", self))
 
     @property
     def some(self):
-        return P(lambda s: r if (r := self.many(s))[0] else None)
+        many = self.many
+        return P(lambda s, i: r if (r := many(s, i))[0] else None, self.first, node=("some", self))
+
+    # packrat memoization keyed by (parser, position), for grammars that re-parse the same input
+    @property
+    def memo(self):
+        def r(s, i):
+            global _memo_input
+            if s is not _memo_input:
+                _memo.clear()
+                _memo_input = s
+            if (key := (id(self), i)) in _memo:
+                _memo.move_to_end(key)
+                return _memo[key]
+            m = _memo[key] = self(s, i)
+            if len(_memo) > MEMO_SIZE: _memo.popitem(last=False)
+            return m
+        return P(r, self.first, self.empty)
 
     @property
     def join(self): return "".join @ self
 
     def parse(self, s):
-        match self(s):
-            case x,"": return x
+        global _memo_input
+        try: r = self(s, 0)
+        finally: _memo.clear(); _memo_input = None
+        match r:
+            case x, i if i == len(s): return x
             case _: return None
     
+    # a single flat function doing the work of the whole combinator tree, built once
+    def compile(self):
+        if self.compiled is None:
+            self.compiled = P(Compiler().build(self), self.first, self.empty)
+            self.compiled.compiled = self.compiled
+        return self.compiled
+
+    @staticmethod
+    def pure(x): return P(lambda s, i: (x, i), empty=True, node=("pure", x))
+
     @staticmethod
-    def pure(x): return P(lambda s: (x,s))
+    def ref(get): return P(lambda s, i: get()(s, i), node=("ref", get))
 
     @staticmethod
     def liftA2(f):
-        return lambda p1, p2: ((lambda x: lambda y: f(x,y)) @ p1) & p2
+        def lift(p1, p2):
+            p = ((lambda x: lambda y: f(x,y)) @ p1) & p2
+            p.node = ("lift2", f, p1, p2)
+            return p
+        return lift
 
     @staticmethod
     def seqA(ps):
-        return foldl(P.liftA2(lambda x,y: x+[y]), [P.pure([])] + ps)
+        p = foldl(P.liftA2(lambda x,y: x+[y]), [P.pure([])] + ps)
+        p.node = ("seq", ps)
+        return p
+
+FAIL = object()
+REGEX_CLASSES = {str.isspace: r"\s"} # predicates that match exactly like a regex class
+
+def is_char(f):
+    return isinstance(f, MethodWrapperType) and f.__name__ == "__eq__" and type(f.__self__) is str
+
+def literal(p):
+    match p.node:
+        case ("seq", ps) if all(q.node and q.node[0] == "char" and is_char(q.node[1]) for q in ps):
+            return "".join(q.node[1].__self__ for q in ps)
+
+# Emits python source for a combinator tree. Each node becomes statements that either set
+# `out` and advance `i`, or set `out` to FAIL. Failed alternatives and loops restore `i`.
+# Referenced parsers become functions of their own so recursive grammars still work.
+class Compiler:
+    def __init__(self):
+        self.env, self.consts = {"FAIL": FAIL}, {}
+        self.funcs, self.todo = {}, []
+        self.vars = count()
 
-pt = lambda f: P(lambda s: (s[0], s[1:]) if s and f(s[0]) else None)
+    def const(self, x):
+        if id(x) not in self.consts:
+            self.consts[id(x)] = name = f"k{len(self.consts)}"
+            self.env[name] = x
+        return self.consts[id(x)]
+
+    def var(self): return f"v{next(self.vars)}"
+
+    def func(self, p):
+        if id(p) not in self.funcs:
+            self.funcs[id(p)] = f"p{len(self.funcs)}"
+            self.todo.append(p)
+        return self.funcs[id(p)]
+
+    def build(self, root):
+        entry, src = self.func(root), []
+        while self.todo:
+            p, out = self.todo.pop(), self.var()
+            src += [f"def {self.funcs[id(p)]}(s, i):", "    n = len(s)",
+                    *indent(self.emit(p, out)),
+                    f"    return None if {out} is FAIL else ({out}, i)"]
+        exec("\n".join(src), self.env)
+        return self.env[entry]
+
+    def emit(self, p, out):
+        match p.node:
+            case ("ref", get):
+                return self.call(get(), out)
+            case ("char", f) if is_char(f):
+                c = self.const(f.__self__)
+                return [f"if s.startswith({c}, i): {out} = {c}; i += 1", f"else: {out} = FAIL"]
+            case ("char", f):
+                return [f"if i < n and {self.const(f)}(s[i]): {out} = s[i]; i += 1", f"else: {out} = FAIL"]
+            case ("pure", x):
+                return [f"{out} = {self.const(x)}"]
+            case ("regex", rx, f, _):
+                m = self.var()
+                return [f"{m} = {self.const(rx)}.match(s, i)",
+                        f"if {m}: {out} = {self.const(f)}({m}); i = {m}.end()", f"else: {out} = FAIL"]
+            case ("map", f, q) if f == "".join and (lit := literal(q)) is not None:
+                c = self.const(lit)
+                return [f"if s.startswith({c}, i): {out} = {c}; i += {len(lit)}", f"else: {out} = FAIL"]
+            case ("map", f, q) if f == "".join and q.node and q.node[0] in ("many", "some") \
+                                 and q.node[1].node and q.node[1].node[0] == "char":
+                j = self.var()
+                lines = self.scan(q.node[1].node[1], j)
+                lines.append(f"{out} = s[i:{j}]; i = {j}")
+                if q.node[0] == "some": lines.append(f"if not {out}: {out} = FAIL")
+                return lines
+            case ("map", f, q):
+                t = self.var()
+                return [*self.emit(q, t), f"{out} = FAIL if {t} is FAIL else {self.const(f)}({t})"]
+            case ("many" | "some" as kind, q) if q.node and q.node[0] == "char":
+                j = self.var()
+                lines = [*self.scan(q.node[1], j), f"{out} = list(s[i:{j}]); i = {j}"]
+                if kind == "some": lines.append(f"if not {out}: {out} = FAIL")
+                return lines
+            case ("many" | "some" as kind, q):
+                t, acc, i0 = self.var(), self.var(), self.var()
+                lines = [f"{acc} = []", "while True:", f"    {i0} = i", *indent(self.emit(q, t)),
+                         f"    if {t} is FAIL or i == {i0}: i = {i0}; break", f"    {acc}.append({t})",
+                         f"{out} = {acc}"]
+                if kind == "some": lines.append(f"if not {out}: {out} = FAIL")
+                return lines
+            case ("ap", q, r):
+                return self.sequence([q, r], out, lambda a, b: f"{a}({b})")
+            case ("lift2", f, q, r):
+                combine = {fst: lambda a, b: a, snd: lambda a, b: b}.get(f, lambda a, b: f"{self.const(f)}({a}, {b})")
+                return self.sequence([q, r], out, combine)
+            case ("seq", qs):
+                return self.sequence(qs, out, lambda *vs: f"[{', '.join(vs)}]")
+            case ("alt", alts):
+                c, i0 = self.var(), self.var()
+                lines = [f"{c} = s[i] if i < n else ''", f"{i0} = i", f"{out} = FAIL"]
+                for q in alts:
+                    guard = f"{out} is FAIL"
+                    if (ks := self.firsts(q)) is not None:
+                        guard += f" and {c} in {self.const(ks)}"
+                    elif q.first is not None and not (q.node and q.node[0] == "char"):
+                        guard += f" and {c} and {self.const(q.first)}({c})"
+                    lines += [f"if {guard}:", *indent(self.emit(q, out)), f"    if {out} is FAIL: i = {i0}"]
+                return lines
+            case _:
+                return self.call(p, out)
+
+    # the finite set of characters p can start with, or None if unknown
+    def firsts(self, p):
+        if p.first is None: return None
+        match p.node:
+            case ("char", f) if is_char(f):
+                return frozenset(f.__self__)
+            case ("map", _, q) | ("some", q):
+                return self.firsts(q)
+            case ("regex", *_, chars):
+                return chars
+            case ("ap", q, r) | ("lift2", _, q, r):
+                return self.firsts(r if q.empty else q)
+            case ("seq", qs) if qs:
+                return self.firsts(next((q for q in qs if not q.empty), qs[-1]))
+            case ("alt", alts):
+                sets = [self.firsts(q) for q in alts]
+                return None if None in sets else frozenset().union(*sets)
+        return None
+
+    def call(self, p, out):
+        r, f = self.var(), self.func(p) if p.node else self.const(p.p)
+        return [f"{r} = {f}(s, i)", f"if {r} is None: {out} = FAIL", f"else: {out}, i = {r}"]
+
+    # move `j` past every character matching f, starting at i
+    def scan(self, f, j):
+        if f in REGEX_CLASSES:
+            return [f"{j} = {self.const(re.compile(REGEX_CLASSES[f] + '*'))}.match(s, i).end()"]
+        test = f"s[{j}] == {self.const(f.__self__)}" if is_char(f) else f"{self.const(f)}(s[{j}])"
+        return [f"{j} = i", f"while {j} < n and {test}: {j} += 1"]
+
+    def sequence(self, qs, out, combine):
+        vs = [self.var() for _ in qs]
+        lines = ["while True:"]
+        for q, v in zip(qs, vs):
+            lines += [*indent(self.emit(q, v)), f"    if {v} is FAIL: {out} = FAIL; break"]
+        return lines + [f"    {out} = {combine(*vs)}", "    break"]
+
+def indent(lines):
+    return ["    " + l for l in lines]
+
+pt = lambda f: P(lambda s, i: (s[i], i + 1) if i < len(s) and f(s[i]) else None, f, node=("char", f))
 pd = pt(str.isdigit)
 pn = int @ pd.some.join
 pc = lambda c: pt(c.__eq__)
@@ -65,13 +280,32 @@ ps = lambda s: P.seqA([pc(c) for c in s]).join
 ws = pt(str.isspace).many
 sepby = lambda sep, p: P.liftA2(lambda f,rs:[f]+rs)(p,(((ws>sep)>ws)>p).many) | P.pure([])
 
-pJson = P(lambda s: (pNull | pBool | pDigit | pLit | pArray | pObject)(s)) # avoid forward declaration
+# whole tokens in one regex match, f builds the value from the match object
+pr = lambda rx, f, chars: P(lambda s, i: (f(m), m.end()) if (m := rx.match(s, i)) else None,
+                            frozenset(chars).__contains__, node=("regex", rx, f, frozenset(chars)))
+
+NUMBER = re.compile(r"-?(?:0|[1-9][0-9]*)((?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)")
+STRING = re.compile(r'"([^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*)"')
+ESCAPE = re.compile(r"\\u([dD][89abAB][0-9a-fA-F]{2})\\u([dD][c-fC-F][0-9a-fA-F]{2})|\\u([0-9a-fA-F]{4})|\\(.)")
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+def number(m): return float(m[0]) if m[1] else int(m[0])
+
+def unescape(m):
+    return m[1] if "\\" not in m[1] else ESCAPE.sub(escaped, m[1])
+
+def escaped(e):
+    if e[1]: return chr(0x10000 + (int(e[1], 16) - 0xD800 << 10) + int(e[2], 16) - 0xDC00)
+    return chr(int(e[3], 16)) if e[3] else ESCAPES[e[4]]
+
+pJson = P.ref(lambda: pValue) # avoid forward declaration
 pNull = (lambda _:None) @ ps("null")
 pBool = (lambda r:r=="true") @ (ps("true") | ps("false"))
-pDigit = pn
-pLit = (pc("\"") > (ps("\\\"") | pt(lambda c: c!="\"")).many.join) < pc("\"")
+pDigit = pr(NUMBER, number, "-0123456789")
+pLit = pr(STRING, unescape, '"')
 pArray = (((pc("[") > ws) > sepby(pc(","), pJson)) < ws) < pc("]")
 pObject = (((pc("{") > ws) > (dict @ sepby(pc(","), P.liftA2(lambda k,v:(k,v))((pLit<ws)<pc(":"),ws>pJson)))) < ws) < pc("}")
+pValue = pNull | pBool | pDigit | pLit | pArray | pObject
 
 
 assert pc('a').parse("a") == "a"
@@ -93,3 +327,19 @@ assert pArray.parse("[1,2,3]") == [1,2,3]
 assert pLit.parse('"hej"') == "hej"
 assert pObject.parse('{"key": "value"}') == {"key": "value"}
 assert pJson.parse('[1,2,3,"hello","world",[1,2,3,4, {"key": "value", "one": [1,2,3]}]]') == [1,2,3,"hello","world",[1,2,3,4,{"key": "value", "one": [1,2,3]}]]
+assert (ps("ab") | ps("ac") | pc("b")).parse("ac") == "ac"
+assert (ps("ab") | pc("a").many.join).parse("aa") == "aa"
+assert pc("a").memo.some.join.parse("aaa") == "aaa"
+assert pArray.parse("[" + ",".join(["1"] * 5000) + "]") == [1] * 5000
+assert pLit.parse('"' + "a" * 100000 + '"') == "a" * 100000
+assert pJson.compile().parse('[1, "a", {"k": [true, false, null]}, "\\"x"]') == [1, "a", {"k": [True, False, None]}, '"x']
+assert pJson.compile().parse('[1,') == None
+assert pJson.compile() is pJson.compile()
+assert (pc('a').memo | pc('b')).compile().parse("b") == "b" # alternatives without a node are called as they are
+assert (ps("ab") | pc("a").many.join).compile().parse("aa") == "aa"
+assert pJson.compile().parse("[" * 500 + "]" * 500) is not None # the interpreted parser overflows the stack here
+assert pJson.parse('[-1, 0, 2.5, -0.5e-3, 1E2, 10]') == [-1, 0, 2.5, -0.0005, 100.0, 10]
+assert pJson.parse('[01]') == None and pJson.parse('[1.]') == None and pJson.parse('[-]') == None
+assert pLit.parse(r'"a\"b\\c\/d\b\f\n\r\tå\ud83d\ude00\udc00"') == 'a"b\\c/d\b\f\n\r\tå\U0001F600\udc00'
+assert pLit.parse(r'"\x"') == None and pLit.parse('"a\nb"') == None
+assert pJson.compile().parse(r'{"k\n": [-1.5e3, "å"]}') == {"k\n": [-1500.0, "å"]}
@@ -0,0 +1,180 @@
+import codecs, re
+from oojson import pBool, pDigit, pLit, pNull, ws
+
+CHUNK = 1 << 16
+
+# first character of a scalar -> the oojson parser reading it
+scalars = {'"': pLit, "t": pBool, "f": pBool, "n": pNull, **{d: pDigit for d in "-0123456789"}}
+literals = ["true", "false", "null"]
+numeric = set("0123456789.eE+-") # characters that may continue a number into the next chunk
+STRING_END = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S) # up to a closing quote or a trailing backslash
+NUMBER_END = re.compile(r"[0-9.eE+-]*")
+
+# Incremental event parser. feed() takes str or utf-8 bytes chunks and returns the events
+# that became available, close() flushes the rest. Memory is bounded by the nesting depth and
+# the longest single token, never by the size of the document. A token split across chunks is
+# kept as a list of pieces, and only each new piece is searched for its end, so it is parsed once.
+#
+# Events are (kind, value) pairs: ("start_object", None), ("key", k), ("value", x),
+# ("end_object", None), ("start_array", None) and ("end_array", None).
+class Parser:
+    def __init__(self):
+        self.pending, self.base = [], 0 # the unparsed text in pieces, base is the document offset of its start
+        self.escaped = False # whether a pending string's last piece ends in an unpaired backslash
+        self.stack = []
+        self.expect = "value"
+        self.closed = False
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+
+    def feed(self, chunk):
+        text = self.decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        self.pending.append(text)
+        if len(self.pending) > 1 and not self.ends(text): return []
+        return self.events()
+
+    def close(self):
+        self.pending.append(self.decoder.decode(b"", final=True))
+        self.closed = True
+        events = self.events()
+        if self.stack or self.expect != "value" or self.pending:
+            self.fail("unexpected end of input", sum(map(len, self.pending)))
+        return events
+
+    # whether the pending token ends within text; literals are at most 4 characters and always rescanned
+    def ends(self, text):
+        kind = self.pending[0][0]
+        if kind == '"':
+            if not text: return False
+            j = STRING_END.match(text, 1 if self.escaped else 0).end()
+            self.escaped = j == len(text) - 1 and text[j] == "\\"
+            return j < len(text) and not self.escaped
+        if kind in numeric: return NUMBER_END.match(text).end() < len(text)
+        return True
+
+    def fail(self, msg, i):
+        raise ValueError(f"{msg} at offset {self.base + i}")
+
+    def scalar(self, buf, i):
+        p = scalars.get(buf[i])
+        if p is None: self.fail(f"unexpected {buf[i]!r}", i)
+        match p(buf, i):
+            case None if self.closed: self.fail("invalid value", i)
+            case None if p in (pBool, pNull) and not any(w.startswith(buf[i:i+5]) for w in literals):
+                self.fail("invalid literal", i)
+            case x, j if p is not pDigit or self.closed or j < len(buf) and buf[j] not in numeric:
+                return x, j
+        return None # the token may continue in the next chunk
+
+    def closing(self, buf, i, events):
+        kind = self.stack.pop()
+        if buf[i] != ("]" if kind == "array" else "}"): self.fail(f"unexpected {buf[i]!r}", i)
+        events.append((f"end_{kind}", None))
+        self.expect = "comma" if self.stack else "value"
+
+    def events(self):
+        buf, i, events = "".join(self.pending), 0, []
+        while (i := ws(buf, i)[1]) < len(buf):
+            c, expect = buf[i], self.expect
+            if expect in ("value", "value_or_end"):
+                if c == "]" and expect == "value_or_end":
+                    self.closing(buf, i, events)
+                elif c in "[{":
+                    kind = "array" if c == "[" else "object"
+                    self.stack.append(kind)
+                    events.append((f"start_{kind}", None))
+                    self.expect = "value_or_end" if c == "[" else "key_or_end"
+                else:
+                    if (r := self.scalar(buf, i)) is None: break
+                    events.append(("value", r[0]))
+                    self.expect = "comma" if self.stack else "value"
+                    i = r[1]
+                    continue
+            elif expect in ("key", "key_or_end"):
+                if c == "}" and expect == "key_or_end":
+                    self.closing(buf, i, events)
+                elif c != '"':
+                    self.fail(f"unexpected {c!r}", i)
+                else:
+                    if (r := self.scalar(buf, i)) is None: break
+                    events.append(("key", r[0]))
+                    self.expect = "colon"
+                    i = r[1]
+                    continue
+            elif expect == "colon":
+                if c != ":": self.fail(f"unexpected {c!r}", i)
+                self.expect = "value"
+            elif c == ",":
+                self.expect = "value" if self.stack[-1] == "array" else "key"
+            else:
+                self.closing(buf, i, events)
+            i += 1
+        rest = buf[i:]
+        self.pending = [rest] if rest else []
+        if rest and rest[0] not in "tfn": # a string or number, not a literal
+            self.escaped = False
+            if self.ends(rest[1:]): self.fail("invalid value", i) # complete, so it will never parse
+        self.base += i
+        return events
+
+def iter_events(chunks):
+    parser = Parser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+# every complete top-level value, as soon as its last event is seen
+def iter_values(chunks):
+    stack = []
+    for kind, x in iter_events(chunks):
+        match kind:
+            case "start_object": stack.append([{}, None]); continue
+            case "start_array": stack.append([[], None]); continue
+            case "key": stack[-1][1] = x; continue
+            case "end_object" | "end_array": x = stack.pop()[0]
+        if not stack:
+            yield x
+        elif isinstance(stack[-1][0], list):
+            stack[-1][0].append(x)
+        else:
+            stack[-1][0][stack[-1][1]] = x
+
+def read_chunks(fileobj, size=CHUNK):
+    while chunk := fileobj.read(size):
+        yield chunk
+
+def iter_ndjson(fileobj):
+    return iter_values(read_chunks(fileobj))
+
+
+if __name__ == "__main__":
+    import io
+    doc = '{"a": [1, 22, {"b": null}], "c": true, "d": "x\\"y\\u00e5"} [false] -7.5e1'
+    for size in [1, 2, 3, len(doc)]:
+        chunks = [doc[i:i+size] for i in range(0, len(doc), size)]
+        assert list(iter_values(chunks)) == [{"a": [1, 22, {"b": None}], "c": True, "d": 'x"yå'}, [False], -75.0], \
+                "Values should not depend on chunk boundaries"
+    assert list(iter_events(['[1, {"k"', ': "v"}]'])) == [("start_array", None), ("value", 1), ("start_object", None),
+            ("key", "k"), ("value", "v"), ("end_object", None), ("end_array", None)], "Events should be emitted"
+    p = Parser()
+    assert p.feed('[12') == [("start_array", None)] and p.feed('3,') == [("value", 123)], "Tokens should span chunks"
+    assert p.feed('1.') == [] and p.feed('5e') == [] and p.feed('2,') == [("value", 150.0)], \
+            "Numbers should span chunks"
+    assert p.feed("tr") == [] and p.feed("ue]") == [("value", True), ("end_array", None)], "Literals should span chunks"
+    assert list(iter_values([b'["\xc3', b'\xa5"]'])) == [["å"]], "Multi-byte characters should span chunks"
+    assert list(iter_ndjson(io.BytesIO(b'{"n": 1}\n{"n": 2}\n'))) == [{"n": 1}, {"n": 2}], "ndjson should work"
+    for bad in ["[1,,2]", "[1 2]", '{"a" 1}', "[1}", "[tx]", "[1"]:
+        try: list(iter_values([bad]))
+        except ValueError: continue
+        assert False, f"{bad} should be rejected"
+    try: list(iter_values(["[1,", "2,]"])); assert False, "Trailing commas should be rejected"
+    except ValueError as e: assert str(e) == "unexpected ']' at offset 5", "Errors should report document offsets"
+    p = Parser()
+    assert p.feed('["a\\') == [("start_array", None)] and p.feed('"b\\') == [] and p.feed('\\') == [] and \
+            p.feed('"]') == [("value", 'a"b\\'), ("end_array", None)], "Escapes should span chunks"
+    import time
+    text = '["' + "x\\n" * (1 << 18) + '", 1' + "2" * 4000 + "]"
+    t = time.perf_counter()
+    assert list(iter_values(text[i:i+1024] for i in range(0, len(text), 1024)))[0][0] == "x\n" * (1 << 18) and \
+            time.perf_counter() - t < 1, "Tokens over many small chunks should be parsed in linear time"
+    deep = "[" * 50 + "]" * 50
+    assert list(iter_events(c for c in deep))[-1] == ("end_array", None), "Character-sized chunks should work"
@@ -1,40 +1,36 @@
 #!/bin/env python3
 import sys, operator, math
-tokens = sys.stdin.readlines()
-stack = []
 
-def pop():
-    global stack
-    return stack.pop()
+binary = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv, "^": operator.pow}
 
-def push(x):
-    global stack
-    stack.append(x)
-
-def op1(f):
-    return f(pop())
-
-def op2(f):
-    y,x = pop(), pop()
-    return f(x,y)
-
-for tok in filter(bool, map(str.strip, tokens)):
-    match tok:
-        case "+":
-            push(op2(operator.add))
-        case "-":
-            push(op2(operator.sub))
-        case "*":
-            push(op2(operator.mul))
-        case "/":
-            push(op2(operator.truediv))
-        case "^":
-            push(op2(operator.pow))
-        case _:
-            if hasattr(math, tok):
-                push(op1(getattr(math, tok))) 
-            else:
-                push(float(tok))
-
-print("\n".join(map(str, stack)))
+# runs the rpn tokens on a stack machine, returning what is left on the stack,
+# with names that are not in math looked up in env, and "=name" keeping the top of the stack as name
+def evaluate(tokens, env=None):
+    env = dict(env or {})
+    stack = []
+    pop, push = stack.pop, stack.append
+    for tk in filter(bool, map(str.strip, tokens)):
+        if tk in binary:
+            y,x = pop(), pop()
+            push(binary[tk](x,y))
+        elif isinstance(f := getattr(math, tk, None), float):
+            push(f)
+        elif f is not None:
+            push(f(pop()))
+        elif tk.startswith("="):
+            env[tk[1:]] = stack[-1]
+        elif tk in env:
+            push(env[tk])
+        else:
+            push(float(tk))
+    return stack
 
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--stream"]:
+        import tok
+        failed = []
+        tok.write_batched("\n".join(map(str, stack)) + "\n"
+                          for stack in tok.each(evaluate, tok.expressions(sys.stdin), failed))
+        sys.exit(1 if failed else 0)
+    else:
+        print("\n".join(map(str, evaluate(sys.stdin.readlines()))))
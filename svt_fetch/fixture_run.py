@@ -0,0 +1,46 @@
+#!/bin/env python3
+# Runs svt_fetch_rss against a local http.server serving fixture/, where rss.xml lists three
+# articles and one link that is not there (404), and checks the text written for each.
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os import listdir, path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from svt_fetch_rss import run
+
+FIXTURE = path.join(path.dirname(path.abspath(__file__)), "fixture")
+
+expected = {
+    "forsta-artikeln": "Regeringen presenterade på tisdagen sin budget.",
+    "andra-artikeln": "Snön föll över hela Norrland.",
+    "tredje-artikeln": "Matchen slutade 2–1.Publiken jublade.",
+}
+
+# fixture files as they are, except that rss.xml gets the server's own address for {base}
+class Handler(SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/rss.xml": return super().do_GET()
+        with open(path.join(FIXTURE, "rss.xml"), "rb") as f:
+            body = f.read().replace(b"{base}", f"http://{self.headers['Host']}".encode())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): pass
+
+if __name__ == "__main__":
+    with ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=FIXTURE)) as server:
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with TemporaryDirectory() as out:
+                links = run(out, f"http://127.0.0.1:{server.server_port}/rss.xml", workers=2, rate=50, parsers=2)
+                assert links == 4, "Every item in the feed should be fetched"
+                assert sorted(listdir(out)) == sorted(expected), "Missing articles (404) should not be written"
+                for title, text in expected.items():
+                    with open(path.join(out, title)) as f:
+                        assert f.read() == text, f"{title} should contain only its article text"
+        finally:
+            server.shutdown()
+    print("ok")
@@ -1,43 +1,98 @@
 #!/bin/env python3
-from requests import Session
-from bs4 import BeautifulSoup
-from sys import stderr, argv
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from os import makedirs
 from re import compile as compile_re
-from os import mkdir
+from sys import stderr
+from threading import Lock
+from time import monotonic, sleep
+from urllib.parse import urlsplit
+from bs4 import BeautifulSoup
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
 
-assert len(argv) == 2, "usage: svt_fetch_rss OUTDIR"
+RSS_URL = "https://svt.se/rss.xml"
 
-_, outdir = argv
-try: mkdir(outdir);
-except FileExistsError: ...
 html_parser = lambda d: BeautifulSoup(d, "lxml")
 xml_parser = lambda d: BeautifulSoup(d, "xml")
 
-with Session() as s: 
-    rss_r = s.get("https://svt.se/rss.xml")
-    
-    assert rss_r.ok, f"failed to fetch rss.xml ({rss_rstatus_code})" 
-    rss = xml_parser(rss_r.text)
+# at most `rate` requests per second to each host, evenly spaced (no limit if rate is 0)
+class HostRate:
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.slots = {} # host -> the earliest time of its next request
+        self.lock = Lock()
+
+    def wait(self, url):
+        if not self.interval: return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = monotonic()
+            at = max(now, self.slots.get(host, now))
+            self.slots[host] = at + self.interval
+        sleep(at - now)
+
+def fetch(s, rate, link):
+    rate.wait(link)
+    r = s.get(link)
+    return r.content if r.ok else None
+
+# runs in the parser processes, so it only takes and returns plain data
+def article_text(content):
+    html = html_parser(content.decode())
+    article = html.find(itemprop="articleBody")
+
+    # remove "no-javascript" reminder
+    if (msg := article.find(**{"class":compile_re("NoScriptMessage.*")})) is not None:
+        msg.decompose()
+    return article.get_text()
 
-    links = [item.link.string
-             for item in rss.rss.channel.find_all("item")]
+# Writes the text of every article in the rss feed to outdir. Up to `workers` articles are
+# downloaded at once over one pooled session, and each is parsed in a separate process as soon
+# as it arrives, so neither the network nor the parsing waits for the other.
+def run(outdir, rss_url=RSS_URL, workers=8, rate=0, parsers=None):
+    makedirs(outdir, exist_ok=True)
+    with Session() as s, ThreadPoolExecutor(workers) as fetchers, ProcessPoolExecutor(parsers) as parse_pool:
+        for prefix in ("http://", "https://"):
+            s.mount(prefix, HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
+        rss_r = s.get(rss_url)
 
-    for link in links:
-        art_r = s.get(link)
+        assert rss_r.ok, f"failed to fetch {rss_url} ({rss_r.status_code})"
+        rss = xml_parser(rss_r.text)
 
-        if not art_r.ok:
-            print(f"failed to fetch {link}", file=stderr)
-            continue
+        links = [item.link.string
+                 for item in rss.rss.channel.find_all("item")]
 
-        html = html_parser(art_r.content.decode())
-        article = html.find(itemprop="articleBody") 
+        limit = HostRate(rate)
+        downloads = {fetchers.submit(fetch, s, limit, link): link for link in links}
+        parses = {}
+        for d in as_completed(downloads):
+            link = downloads[d]
+            try: content = d.result()
+            except RequestException: content = None
+            if content is None:
+                print(f"failed to fetch {link}", file=stderr)
+                continue
+            parses[parse_pool.submit(article_text, content)] = link
 
-        # remove "no-javascript" reminder
-        if (msg := article.find(**{"class":compile_re("NoScriptMessage.*")})) is not None:
-            msg.decompose()
-        content = article.get_text()
+        for p in as_completed(parses):
+            link = parses[p]
+            try: content = p.result()
+            except Exception as e:
+                print(f"failed to parse {link} ({e!r})", file=stderr)
+                continue
 
-        _, title = link.rsplit("/", 1)
-        with open(f"{outdir}/{title}", "w") as f:
-            f.write(content)
+            _, title = link.rsplit("/", 1)
+            with open(f"{outdir}/{title}", "w") as f:
+                f.write(content)
+    return len(links)
 
+if __name__ == "__main__":
+    args = ArgumentParser(description="Write the text of every headline article in the rss feed to OUTDIR.")
+    args.add_argument("outdir")
+    args.add_argument("--rss", default=RSS_URL, help="the feed to read (default: %(default)s)")
+    args.add_argument("--workers", type=int, default=8, help="articles downloaded at once (default: %(default)s)")
+    args.add_argument("--rate", type=float, default=0, help="requests per second to each host, 0 for no limit")
+    args.add_argument("--parsers", type=int, default=None, help="parser processes (default: one per cpu)")
+    a = args.parse_args()
+    run(a.outdir, a.rss, a.workers, a.rate, a.parsers)
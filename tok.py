@@ -1,10 +1,7 @@
 #!/bin/env python3
 import re, sys
 
-if sys.argv[1:]:
-  inp = " ".join(sys.argv[1:])
-else:
-  inp = sys.stdin.read()
+BATCH = 256 # results written between flushes in stream mode, the first one is flushed right away
 
 var = r"[_a-zA-Z]\w*"
 num = r"\d+(?:\.\d+)?"
@@ -13,5 +10,57 @@ string2 = r"'(?:\\'|[^'])*'"
 op = r"[*+^:!|#@$%&/=\\\-`~]+"
 contr = r"[\[\]{}(),.]"
 r = "|".join([var, num, string1, string2, op, contr])
+pattern = re.compile(r)
 
-print("\n".join(re.findall(r, inp)))
+def tokens(inp):
+  return pattern.findall(inp)
+
+# tokens of each expression in the lines, expressions end at a blank line or a ';'
+def stream(lines):
+  expr = []
+  for line in lines:
+    for i, part in enumerate(line.split(";")):
+      if i and expr:
+        yield expr
+        expr = []
+      expr += tokens(part)
+    if not line.strip() and expr:
+      yield expr
+      expr = []
+  if expr: yield expr
+
+# the lines grouped per expression, as written in stream mode: one token per line, a blank line after each
+def expressions(lines):
+  group = []
+  for line in lines:
+    if line.strip(): group.append(line)
+    elif group:
+      yield group
+      group = []
+  if group: yield group
+
+# f of each expression, where one that fails is reported on stderr by its number (and counted in
+# `failed`) instead of ending the stream
+def each(f, exprs, failed, errors=(ArithmeticError, LookupError, ValueError)):
+  for n, expr in enumerate(exprs, 1):
+    try: yield f(expr)
+    except errors as e:
+      failed.append(n)
+      print(f"expression {n}: {e}", file=sys.stderr)
+
+def write_batched(outputs, out=sys.stdout):
+  for n, s in enumerate(outputs):
+    out.write(s)
+    if n % BATCH == 0: out.flush()
+  out.flush()
+
+if __name__ == "__main__":
+  if sys.argv[1:] == ["--stream"]:
+    write_batched("\n".join(expr) + "\n\n" for expr in stream(sys.stdin))
+  else:
+    if sys.argv[1:]:
+      inp = " ".join(sys.argv[1:])
+    else:
+      inp = sys.stdin.read()
+
+    print("\n".join(tokens(inp)))
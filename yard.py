@@ -1,9 +1,6 @@
 #!/bin/env python3
-import sys
-
-tokens = sys.stdin.readlines()
-opstack = []
-stack = []
+import re, sys, math
+import tok, pol
 
 def to_num(s):
     try: return int(s)
@@ -11,40 +8,130 @@ def to_num(s):
         try: return float(s)
         except: return None
 
-ops = ["^", "*", "/", "+", "-"]
+# binding strength, and whether equal strength groups to the left
+prec = {"^": 3, "*": 2, "/": 2, "+": 1, "-": 1}
+left = {"*", "/", "+", "-"}
+ops = list(prec)
 def higher(o1,o2):
-    return ops.index(o1) < ops.index(o2)
+    return prec[o1] > prec[o2] or prec[o1] == prec[o2] and o2 in left
 
 def is_func(f):
-    import math
-    return hasattr(math, f)
-
-for tk in filter(bool, map(str.strip, tokens)):
-    if (n := to_num(tk)) is not None:
-        stack.append(n)
-    elif is_func(tk):
-        opstack.append(tk)
-    elif tk in ops:
-        while opstack and opstack[-1] != "(" and higher(opstack[-1], tk):
-            stack.append(opstack.pop())
-        opstack.append(tk)
-    elif tk == ",":
-        while opstack[-1] != "(":
-            stack.append(opstack.pop())
-    elif tk == "(":
-        opstack.append(tk)
-    elif tk == ")":
-        while opstack[-1] != "(":
-            stack.append(opstack.pop())
-        opstack.pop()
-        if opstack and is_func(opstack[-1]):
-            stack.append(opstack.pop())
-    else:
-        print("Unknown token", tk, file=sys.stderr)
-        sys.exit(1)
+    return callable(getattr(math, f, None))
+
+def is_const(c):
+    return isinstance(getattr(math, c, None), float)
+
+def is_var(v):
+    return re.fullmatch(tok.var, v) is not None
+
+# reverse polish notation of the tokens, numbers converted and everything else kept as strings
+def rpn(tokens):
+    opstack = []
+    stack = []
+    for tk in filter(bool, map(str.strip, tokens)):
+        if (n := to_num(tk)) is not None:
+            stack.append(n)
+        elif is_const(tk):
+            stack.append(tk)
+        elif is_func(tk):
+            opstack.append(tk)
+        elif is_var(tk):
+            stack.append(tk)
+        elif tk in ops:
+            while opstack and opstack[-1] != "(" and not is_func(opstack[-1]) and higher(opstack[-1], tk):
+                stack.append(opstack.pop())
+            opstack.append(tk)
+        elif tk == ",":
+            while opstack and opstack[-1] != "(":
+                stack.append(opstack.pop())
+            if not opstack: raise ValueError(f"{tk} outside parentheses")
+        elif tk == "(":
+            opstack.append(tk)
+        elif tk == ")":
+            while opstack and opstack[-1] != "(":
+                stack.append(opstack.pop())
+            if not opstack: raise ValueError(f"Unmatched {tk}")
+            opstack.pop()
+            if opstack and is_func(opstack[-1]):
+                stack.append(opstack.pop())
+        else:
+            raise ValueError(f"Unknown token {tk}")
+
+    while opstack:
+        stack.append(opstack.pop())
+    return stack
 
-while opstack:
-    stack.append(opstack.pop())
+# x op unit == x, for the operators that have one on their right (or either side, if they commute)
+units = {"+": (0.0, True), "-": (0.0, False), "*": (1.0, True), "/": (1.0, False), "^": (1.0, False)}
+
+# The rpn as a tree, with numbers as floats, names as str, and (op, *args) for operators and functions.
+# Equal subtrees are built once and shared, so they can be told apart by id.
+def tree(rpn):
+    stack, nodes = [], {}
+    def intern(node):
+        if not isinstance(node, tuple): return node
+        return nodes.setdefault((node[0], *((id(a),) if isinstance(a, tuple) else a for a in node[1:])), node)
+    for tk in rpn:
+        if isinstance(tk, (int, float)): stack.append(float(tk))
+        elif is_const(tk): stack.append(getattr(math, tk))
+        elif len(stack) < (2 if tk in ops else 1 if is_func(tk) else 0):
+            raise ValueError(f"Missing operand for {tk}")
+        elif tk in ops:
+            y, x = stack.pop(), stack.pop()
+            stack.append(intern(fold(tk, x, y)))
+        elif is_func(tk): stack.append(intern(fold(tk, stack.pop())))
+        else: stack.append(tk)
+    return stack
+
+# op applied to args, computed now if they are all numbers and simplified by the units above otherwise
+def fold(op, *args):
+    if all(isinstance(a, float) for a in args):
+        try: return float(pol.binary[op](*args) if op in pol.binary else getattr(math, op)(*args))
+        except (ArithmeticError, TypeError, ValueError): pass # left for evaluation to report
+    if op in units:
+        (x, y), (unit, commutes) = args, units[op]
+        if y == unit: return x
+        if commutes and x == unit: return y
+        if op == "^" and y == 0.0: return 1.0
+    return (op, *args)
+
+# A shorter rpn computing the same values: constant subtrees folded, identities dropped, and
+# subtrees that occur more than once computed once, kept with "=$k" and read back with "$k".
+def optimize(rpn):
+    roots = tree(rpn)
+    seen, stack = {}, list(roots) # uses of each subtree, by id
+    while stack:
+        if isinstance(node := stack.pop(), tuple):
+            seen[id(node)] = seen.get(id(node), 0) + 1
+            if seen[id(node)] == 1: stack.extend(node[1:])
+    # postorder with an explicit stack, where (node, True) means its arguments are already out
+    temps, out, stack = {}, [], [(root, False) for root in reversed(roots)]
+    while stack:
+        node, ready = stack.pop()
+        if not isinstance(node, tuple): out.append(node)
+        elif id(node) in temps: out.append(temps[id(node)])
+        elif ready:
+            out.append(node[0])
+            if seen[id(node)] > 1:
+                temps[id(node)] = f"${len(temps)}"
+                out.append("=" + temps[id(node)])
+        else:
+            stack.append((node, True))
+            stack.extend((arg, False) for arg in reversed(node[1:]))
+    return out
+
+if __name__ == "__main__":
+    flags = set(sys.argv[1:])
+    compile = (lambda tokens: optimize(rpn(tokens))) if "-O" in flags else rpn
+    try:
+        if "--stream" in flags:
+            failed = []
+            tok.write_batched("\n".join(map(str, stack)) + "\n\n"
+                              for stack in tok.each(compile, tok.expressions(sys.stdin), failed))
+            sys.exit(1 if failed else 0)
+        stack = compile(sys.stdin.readlines())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
 
-print("\n".join(map(str, stack)))
-    
+    print("\n".join(map(str, stack)))